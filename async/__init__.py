@@ -5,6 +5,30 @@ with asynchronous code easier.
 """
 from .company import Company
 from .slave import Slave
-from .job import Job
+from .job import Job, DependencyFailed, Priority
+from .cancellation import CancellationToken, Cancelled
+from .future import Future, FunctionJob
+from .dispatcher import Dispatcher
+from .lane import Overflow, QueueFull
+from .tracer import Tracer
+from .retry import RetryPolicy
+from .timer import Timer, TimerHandle
 
-__all__ = ["Company", "Slave", "Job"]
+__all__ = [
+    "Company",
+    "Slave",
+    "Job",
+    "DependencyFailed",
+    "Priority",
+    "CancellationToken",
+    "Cancelled",
+    "Future",
+    "FunctionJob",
+    "Dispatcher",
+    "Overflow",
+    "QueueFull",
+    "Tracer",
+    "RetryPolicy",
+    "Timer",
+    "TimerHandle",
+]
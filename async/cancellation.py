@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+This script contains the class CancellationToken and the exception Cancelled.
+"""
+
+
+class Cancelled(Exception):
+    """
+    The job was cancelled while it was being worked on.
+    """
+    pass
+
+
+class CancellationToken:
+    """
+    Flag shared between whoever may cancel some jobs and the jobs themselves.
+    The same token may be given to many jobs to cancel them all at once.
+    A token may have a parent: it is also cancelled when its parent is, so a
+    job can be cancelled alone or with the rest.
+    """
+    def __init__(self, parent=None):
+        """
+        Constructor.
+        :param parent: Token that cancels this one too.
+        :type parent:  .async.CancellationToken or None
+        """
+        self._cancelled = False
+        self.parent = parent
+
+    @property
+    def is_cancelled(self):
+        """
+        Has it (or its parent) been cancelled?
+        """
+        if self._cancelled:
+            return True
+        return self.parent is not None and self.parent.is_cancelled
+
+    def cancel(self):
+        """
+        Cancels the jobs using this token. Listed jobs are discarded and the
+        ones being worked on should stop at their next check.
+        """
+        self._cancelled = True
+
+    def raise_if_cancelled(self):
+        """
+        Raises Cancelled if it has been cancelled. Meant to be polled from
+        Job.do_work.
+        :raises Cancelled: if it has been cancelled.
+        """
+        if self.is_cancelled:
+            raise Cancelled()
@@ -4,30 +4,134 @@ This script contains the class Company: manages the slaves and the available
 jobs.
 """
 
-from PyQt5.QtCore import QMutex
+import time
+from itertools import count
 
+from PyQt5.QtCore import QMutex, QWaitCondition
+
+from .cancellation import Cancelled
+from .dispatcher import Dispatcher
+from .future import FunctionJob
+from .job import Job, DependencyFailed
+from .lane import Lane, Overflow, QueueFull
 from .slave import Slave
+from .timer import Timer
+from .tracer import Outcome
 
 
 class Company:
     """
     Manages the creation Slaves as well as gives them the Jobs to work on.
+    Slaves are kept alive (idle) for a while after they run out of jobs so
+    they can be reused by the next jobs instead of starting new threads.
+
+    Jobs are listed in lanes (see Job.lane). Each lane limits how many of its
+    jobs are worked on at the same time, so a slow lane cannot take all the
+    slaves. max_slaves is the global limit. Lanes may also limit how many
+    jobs are listed: listing a job in a full lane blocks the producer,
+    rejects the job or drops the oldest one (see .async.Overflow).
+
+    Listed jobs with the same coalesce_key are merged and cancelled jobs are
+    discarded before being worked on.
+
+    Jobs may depend on other jobs (see Job.depends_on). They wait, out of the
+    lanes, until all of them finish, so independent branches run in
+    parallel. If one of them fails, its dependents fail too.
+
+    Jobs may have a deadline for each attempt (see Job.deadline). The
+    company's job_context, a function that returns a context manager for a
+    job, is entered around each attempt so the deadline can be propagated
+    (ie. to the timeouts of the requests).
+
+    Failed jobs with a retry policy (see Job.retry) are listed again after
+    the policy's delay, without keeping a slave busy while waiting.
+
+    Interactive jobs (see .async.Priority) are taken before the rest, and
+    the priority of the waiting jobs grows with aging so none is starved.
+    When all the slaves are busy, background jobs that call
+    Job.yield_point let their slave work on the waiting interactive jobs.
+
+    Jobs can be listed later or periodically (see schedule and
+    schedule_every). A single timer thread lists them when they are due.
+
+    The results are applied in the GUI thread by its dispatcher, so the
+    company must be made in the GUI thread.
+
+    Setting a .async.Tracer to tracer records the lifecycle of the jobs.
     """
-    def __init__(self, max_slaves=1):
+    DEFAULT_LANE = 'default'
+
+    def __init__(self, max_slaves=1, min_slaves=0, idle_timeout=30000,
+                 default_lane_slaves=1, frame_budget=8, aging=0.0,
+                 job_context=None):
         """
         Contructor.
         :param max_slaves: The maximum number of slaves (working threads)
         desired.
         :type max_slaves:  int
+        :param min_slaves: The number of slaves that are kept alive even if
+        they have been idle for longer than idle_timeout.
+        :type min_slaves:  int
+        :param idle_timeout: Milliseconds an idle slave waits for a new job
+        before finishing its thread.
+        :type idle_timeout:  int
+        :param default_lane_slaves: Limit of the lanes that are created when a
+        job is listed in a lane that has not been added. The default lane is
+        only limited by max_slaves.
+        :type default_lane_slaves:  int
+        :param frame_budget: Milliseconds the GUI thread spends applying
+        results before letting the event loop process other events.
+        :type frame_budget:  float
+        :param aging: Priority gained by a listed job for each second it
+        waits.
+        :type aging:  float
+        :param job_context: Called with each job before its slave works on
+        it. The returned context manager wraps Job.do_work. None for no
+        context.
+        :type job_context:  callable or None
         """
         self._max_slaves = max_slaves
+        self._min_slaves = min_slaves
+        self._idle_timeout = idle_timeout
         self._slaves = []
+        self._idle_slaves = []
         self._free_slaves = []
+        self._stopping = False
 
-        self._jobs = []
+        self._spawned = 0
+        self._reused = 0
+
+        self._default_lane_slaves = default_lane_slaves
+        self._aging = aging
+        self._sequence = count()
+        self._lanes = {
+            self.DEFAULT_LANE: Lane(
+                self.DEFAULT_LANE,
+                None,
+                self._sequence,
+                self.__discarded,
+                aging,
+            ),
+        }
+        self._preempted = 0
+        self._rejected = 0
+        self._dropped = 0
+        self._blocked = 0
+        self._coalescing = {}
+        # Jobs discarded because they were cancelled, to be failed once the
+        #  mutex is unlocked
+        self._cancelled = []
 
         self._mutex = QMutex()
         self._free_mutex = QMutex()
+        self._not_full = QWaitCondition()
+
+        self.dispatcher = Dispatcher(frame_budget)
+        self._tracer = None
+
+        self._timer = Timer()
+
+        self.job_context = job_context
 
     @property
     def max_slaves(self):
@@ -35,7 +139,7 @@ class Company:
         The maximum number of slaves (working threads) that may be used.
         """
         self._mutex.lock()
-        r = self.__max_slaves
+        r = self._max_slaves
         self._mutex.unlock()
 
         return r
@@ -43,53 +147,397 @@ class Company:
     @max_slaves.setter
     def max_slaves(self, v):
         self._mutex.lock()
-        self.__max_slaves = v
+        self._max_slaves = v
+        self._mutex.unlock()
+
+    @property
+    def min_slaves(self):
+        """
+        The number of slaves that are kept alive while idle.
+        """
+        self._mutex.lock()
+        r = self._min_slaves
+        self._mutex.unlock()
+
+        return r
+
+    @min_slaves.setter
+    def min_slaves(self, v):
+        self._mutex.lock()
+        self._min_slaves = v
+        self._mutex.unlock()
+
+    @property
+    def idle_timeout(self):
+        """
+        Milliseconds an idle slave waits for a new job before finishing.
+        """
+        self._mutex.lock()
+        r = self._idle_timeout
+        self._mutex.unlock()
+
+        return r
+
+    @idle_timeout.setter
+    def idle_timeout(self, v):
+        self._mutex.lock()
+        self._idle_timeout = v
+        self._mutex.unlock()
+
+    @property
+    def spawned_slaves(self):
+        """
+        Number of slaves (threads) started since the company was created.
+        """
+        self._mutex.lock()
+        r = self._spawned
+        self._mutex.unlock()
+
+        return r
+
+    @property
+    def reused_slaves(self):
+        """
+        Number of times an idle slave has been woken up to work on a job
+        instead of starting a new one.
+        """
+        self._mutex.lock()
+        r = self._reused
+        self._mutex.unlock()
+
+        return r
+
+    @property
+    def preempted_jobs(self):
+        """
+        Number of times a job let its slave work on an interactive job.
+        """
+        self._mutex.lock()
+        r = self._preempted
+        self._mutex.unlock()
+
+        return r
+
+    @property
+    def rejected_jobs(self):
+        """
+        Number of jobs that were not listed because their lane was full.
+        """
+        self._mutex.lock()
+        r = self._rejected
+        self._mutex.unlock()
+
+        return r
+
+    @property
+    def dropped_jobs(self):
+        """
+        Number of listed jobs dropped to make room for newer ones.
+        """
+        self._mutex.lock()
+        r = self._dropped
+        self._mutex.unlock()
+
+        return r
+
+    @property
+    def tracer(self):
+        """
+        The .async.Tracer that records the jobs, or None when not tracing.
+        """
+        return self._tracer
+
+    @tracer.setter
+    def tracer(self, tracer):
+        self._mutex.lock()
+        self._tracer = tracer
+        self.dispatcher.tracer = tracer
+        self._mutex.unlock()
+
+    def add_lane(self, name, max_slaves, max_jobs=None,
+                 overflow=Overflow.BLOCK, block_timeout=None):
+        """
+        Adds a lane or changes the limits of an existing one.
+        :param name: Name of the lane.
+        :type name:  str
+        :param max_slaves: Maximum number of jobs of this lane that may be
+        worked on at the same time. None for no limit (other than
+        max_slaves of the company).
+        :type max_slaves:  int or None
+        :param max_jobs: Maximum number of listed jobs of this lane. None for
+        no limit.
+        :type max_jobs:  int or None
+        :param overflow: What listing a job in the full lane does (see
+        .async.Overflow).
+        :type overflow:  str
+        :param block_timeout: Milliseconds a blocked producer waits before
+        the job is rejected. None waits forever.
+        :type block_timeout:  int or None
+        """
+        self._mutex.lock()
+        lane = self.__lane(name)
+        lane.max_slaves = max_slaves
+        lane.max_jobs = max_jobs
+        lane.overflow = overflow
+        lane.block_timeout = block_timeout
+        if self._blocked:
+            self._not_full.wakeAll()
+        if lane.available:
+            self.__wake_slave()
         self._mutex.unlock()
 
+    def remove_lane(self, name):
+        """
+        Removes a lane if it has no jobs. Returns if it was removed.
+        :param name: Name of the lane.
+        :type name:  str
+        """
+        self._mutex.lock()
+        lane = self._lanes.get(name)
+        removed = (
+            name != self.DEFAULT_LANE
+            and lane is not None
+            and lane.idle
+        )
+        if removed:
+            del self._lanes[name]
+        self._mutex.unlock()
+
+        return removed
+
     def list_job(self, job):
         """
         Lists a job. An Slave will work on it at when no higher priority jobs
         are left (if two jobs have the same priority, the frist listed is
-        executed first).
+        executed first). Listing and taking a job are O(log n).
+        If a job with the same coalesce_key is still listed, this one is
+        merged into it instead: it finishes (for the jobs that depend on it)
+        when the listed one does. If it depends on unfinished jobs, it waits
+        until they finish.
+        If its lane is full, it blocks, raises QueueFull or drops the oldest
+        job of the lane (with any coalesce_key), depending on the lane's
+        overflow policy.
+        Returns the listed job that will do the work.
         :param job: Job that contains the work to be done.
         :type job:  .async.Job
+        :raises .async.QueueFull: if the lane is full and rejects the job.
         """
+        dropped = []
+        blocked_since = None
         self._mutex.lock()
-        if len(self._slaves) < self._max_slaves:
-                slave = Slave(self, job)
-                self._slaves.append(slave)
-                slave.start()
+        while True:
+            listed = self._coalescing.get(job.coalesce_key)
+            if listed is not None and not listed.is_cancelled:
+                listed.merge(job)
+                # Its dependents wait for the listed job
+                job._finished = False
+                job._failure = None
+                listed._merged.append(job)
+                break
+
+            lane = self.__lane(job.lane)
+            if not lane.full:
+                self.__list(job)
+                listed = job
+                break
+
+            if lane.overflow == Overflow.DROP_OLDEST:
+                dropped.append(self.__drop(lane))
+                continue
+            if lane.overflow == Overflow.BLOCK:
+                if blocked_since is None:
+                    blocked_since = time.monotonic()
+                if self.__wait_room(lane, blocked_since):
+                    continue
+
+            self._rejected += 1
+            self.__unlock()
+            self.__dropped(dropped)
+            raise QueueFull(lane.name)
+        self.__unlock()
+
+        self.__dropped(dropped)
+        return listed
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Lists a job that calls fn(*args, **kwargs) in the default lane.
+        Returns its .async.Future. Use FunctionJob to choose the lane or the
+        priority.
+        :param fn: Function to call in a slave.
+        :type fn:  callable
+        """
+        job = FunctionJob(self, fn, args, kwargs)
+        self.list_job(job)
+        return job.future
+
+    def schedule(self, job, delay):
+        """
+        Lists the job after delay seconds. Returns an .async.TimerHandle that
+        can cancel it before it is listed. If its lane rejects it then, the
+        job fails with QueueFull.
+        :param job: Job to list.
+        :type job:  .async.Job
+        :param delay: Seconds to wait.
+        :type delay:  float
+        """
+        return self._timer.call_later(delay, lambda: self.__schedule(job))
+
+    def schedule_every(self, job, interval, jitter=0.0, delay=None):
+        """
+        Lists a job every interval seconds. Returns an .async.TimerHandle
+        that cancels the next listings.
+        :param job: A job, which is not listed again while it is still
+        listed or being worked on, or a function that returns a new job each
+        time.
+        :type job:  .async.Job or callable
+        :param interval: Seconds between two listings.
+        :type interval:  float
+        :param jitter: Fraction of the interval that is added or subtracted
+        randomly, to spread the jobs of different schedules.
+        :type jitter:  float
+        :param delay: Seconds before the first listing. The interval if None.
+        :type delay:  float or None
+        """
+        if isinstance(job, Job):
+            listed = []
+
+            def list_job():
+                if listed and not job._finished:
+                    return
+                if self.__schedule(job):
+                    listed.append(True)
         else:
-            self.__add(job)
+            def list_job():
+                self.__schedule(job())
+
+        return self._timer.call_every(interval, list_job, jitter, delay)
+
+    def shutdown(self):
+        """
+        Finishes all the idle slaves and cancels the scheduled jobs. The
+        working ones finish after the listed jobs are done instead of waiting
+        for new ones. Listing a new job starts the company again.
+        """
+        self._timer.stop()
+
+        self._mutex.lock()
+        self._stopping = True
+        while self._idle_slaves:
+            self._idle_slaves.pop().wake()
         self._mutex.unlock()
 
     def _aquire_job(self, slave):
         """
-        Aquire a job for an slave.
+        Aquire a job for an slave. If there are no jobs the slave waits
+        (idle) until a new job is listed or idle_timeout expires.
+        Returns None when the slave must finish.
         :param slave: Slave that will do the job.
         :type slave:  .async.Slave
         """
         self._mutex.lock()
-        if len(self._jobs) > 0:
-            job = self._jobs.pop()
-        else:
-            job = None
+        while True:
+            job = self.__pop_job()
+            if job is not None or self._stopping:
+                break
+            if self._cancelled:
+                # Fail them before waiting
+                self.__unlock()
+                self._mutex.lock()
+                continue
 
-            # The slave will be free after this (no more jobs to be done).
-            # We can no longer use it but we have to keep an instance until
-            #  it is free to prevent the garbage collector to destroy it too
-            #  soon. So we move it to another list.
-            for i, s in enumerate(self._slaves):
-                if s is slave:
-                    self._slaves.pop(i)
+            self._idle_slaves.append(slave)
+            slave.wait_for_job(self._mutex, self._idle_timeout)
+            if slave in self._idle_slaves:
+                # Nobody woke it up: the idle timeout expired.
+                self._idle_slaves.remove(slave)
+                if len(self._slaves) > self._min_slaves:
+                    break
 
-                    self._free_mutex.lock()
-                    self._free_slaves.append(slave)
-                    self._free_mutex.unlock()
-        self._mutex.unlock()
+        if job is None:
+            self.__retire(slave)
+        self.__unlock()
 
         return job
 
+    def _job_finished(self, job, failure=None):
+        """
+        Tells the company that a slave finished working on a job.
+        Returns if the job is going to be retried.
+        :param job: The finished job.
+        :type job:  .async.Job
+        :param failure: The exception if the job failed or was cancelled.
+        :type failure:  Exception or None
+        """
+        retrying = (
+            failure is not None
+            and job.retry is not None
+            and not isinstance(failure, (Cancelled, DependencyFailed))
+            and job.retry.should_retry(failure, job.attempt)
+        )
+
+        self._mutex.lock()
+        self.__lane(job.lane).working -= 1
+        if self._tracer is not None:
+            self._tracer.work_finished(job, failure)
+            if retrying:
+                self._tracer.finish(job, Outcome.RETRIED)
+            elif isinstance(failure, Cancelled):
+                # Its result is not applied
+                self._tracer.finish(job, Outcome.CANCELLED)
+        if not retrying:
+            self.__finish(job, failure)
+        self.__unlock()
+
+        if retrying:
+            self._timer.call_later(
+                job.retry.delay(job.attempt),
+                lambda: self.__relist(job),
+            )
+
+        return retrying
+
+    def _preempt(self, job):
+        """
+        Returns the interactive job that the slave working on job should work
+        on before continuing, or None. It is only taken when no other slave
+        could take it: all the slaves are busy or its lane is at its limit
+        because of job.
+        :param job: The job that is preempted.
+        :type job:  .async.Job
+        """
+        self._mutex.lock()
+        own_lane = self.__lane(job.lane)
+        slaves_busy = (
+            not self._idle_slaves
+            and len(self._slaves) >= self._max_slaves
+        )
+        best = None
+        for lane in list(self._lanes.values()):
+            head = lane.jobs.peek()
+            if head is None or not head.is_interactive:
+                continue
+            if lane is own_lane:
+                # The job lends its place in the lane
+                working = lane.working - 1
+            elif slaves_busy:
+                working = lane.working
+            else:
+                continue
+            if (
+                (lane.max_slaves is None or working < lane.max_slaves)
+                and (best is None or lane.jobs.key() < best.jobs.key())
+            ):
+                best = lane
+
+        interactive = None
+        if best is not None:
+            interactive = self.__take(best)
+            self._preempted += 1
+        self.__unlock()
+
+        return interactive
+
     def free_slave(self, slave):
         """
         Frees a slave. Removes the last instance of the thread.
@@ -106,11 +554,229 @@ class Company:
                 self._free_slaves.pop(i)
         self._free_mutex.unlock()
 
-    def __add(self, job):
+    def __lane(self, name):
+        # Call with self._mutex locked
+        if name is None:
+            name = self.DEFAULT_LANE
+        lane = self._lanes.get(name)
+        if lane is None:
+            lane = Lane(
+                name,
+                self._default_lane_slaves,
+                self._sequence,
+                self.__discarded,
+                self._aging,
+            )
+            self._lanes[name] = lane
+        return lane
+
+    def __pop_job(self):
+        # Call with self._mutex locked
+        # Takes the job with the highest priority of the lanes that are not
+        #  at their limit.
+        best = None
+        for lane in list(self._lanes.values()):
+            if lane.available and (
+                best is None or lane.jobs.key() < best.jobs.key()
+            ):
+                best = lane
+        if best is None:
+            return None
+        return self.__take(best)
+
+    def __take(self, lane):
+        # Call with self._mutex locked
+        lane.working += 1
+        job = lane.jobs.pop()
+        if self._blocked:
+            self._not_full.wakeAll()
+        if self._coalescing.get(job.coalesce_key) is job:
+            del self._coalescing[job.coalesce_key]
+        if self._tracer is not None:
+            self._tracer.started(job)
+        return job
+
+    def __push(self, job):
+        # Call with self._mutex locked
+        lane = self.__lane(job.lane)
+        lane.jobs.push(job)
+        if lane.available:
+            self.__wake_slave()
+
+    def __finish(self, job, failure):
+        # Call with self._mutex locked
+        # Lists the dependents that no longer wait for any job, or that fail
+        #  because of this one. The jobs merged into it finish too.
+        job._finished = True
+        job._failure = failure
+        merged = job._merged
+        job._merged = []
+        for merged_job in merged:
+            self.__finish(merged_job, failure)
+        dependents = job._dependents
+        job._dependents = []
+        for dependent in dependents:
+            if dependent._dependency_error is not None:
+                continue
+            if failure is not None:
+                dependent._dependency_error = DependencyFailed(job, failure)
+                self.__push(dependent)
+            else:
+                dependent._waiting -= 1
+                if dependent._waiting == 0:
+                    self.__push(dependent)
+
+    def __list(self, job):
+        # Call with self._mutex locked
+        # Lists a job that is not merged. It waits out of the lanes if it
+        #  depends on unfinished jobs.
+        if job.coalesce_key is not None:
+            self._coalescing[job.coalesce_key] = job
+
+        self._stopping = False
+        job.attempt = 0
+        if self._tracer is not None:
+            self._tracer.enqueued(job)
+
+        job._finished = False
+        job._failure = None
+        job._dependency_error = None
+        job._waiting = 0
+        for dependency in job.depends_on:
+            if not dependency._finished:
+                dependency._dependents.append(job)
+                job._waiting += 1
+            elif (
+                dependency._failure is not None
+                and job._dependency_error is None
+            ):
+                job._dependency_error = DependencyFailed(
+                    dependency,
+                    dependency._failure,
+                )
+
+        if job._waiting == 0 or job._dependency_error is not None:
+            self.__push(job)
+
+    def __wait_room(self, lane, blocked_since):
         # Call with self._mutex locked
-        l = len(self._jobs)
-        i = 0
-        while i < l and self._jobs[i].priority < job.priority:
-            i += 1
+        # Waits until a job is taken. Returns False if the lane's block
+        #  timeout expired.
+        if lane.block_timeout is None:
+            timeout = None
+        else:
+            waited = (time.monotonic() - blocked_since) * 1000
+            timeout = int(lane.block_timeout - waited)
+            if timeout <= 0:
+                return False
+
+        self._blocked += 1
+        if timeout is None:
+            self._not_full.wait(self._mutex)
+        else:
+            self._not_full.wait(self._mutex, timeout)
+        self._blocked -= 1
+        return True
+
+    def __drop(self, lane):
+        # Call with self._mutex locked
+        # Removes the oldest job of the lane, which fails. It may have any
+        #  coalesce_key: the listed job with the key of the new one (if any)
+        #  took it in (see Overflow.DROP_OLDEST).
+        job = lane.jobs.pop_oldest()
+        self._dropped += 1
+        if self._coalescing.get(job.coalesce_key) is job:
+            del self._coalescing[job.coalesce_key]
+        self.__finish(job, QueueFull(lane.name))
+        if self._tracer is not None:
+            self._tracer.finish(job, Outcome.DROPPED)
+        return job
+
+    def __dropped(self, jobs):
+        # Fails the dropped jobs (with self._mutex unlocked)
+        for job in jobs:
+            job.failed(job._failure)
+            self.dispatcher.post(job, job._failure)
+
+    def __schedule(self, job):
+        # Lists a scheduled job. If its lane is full the job fails with
+        #  QueueFull, like a dropped one, since nobody lists it to catch it
+        #  (it is counted as rejected). Returns if it was listed.
+        try:
+            self.list_job(job)
+        except QueueFull as e:
+            self._mutex.lock()
+            self.__finish(job, e)
+            self.__unlock()
+            self.__dropped([job])
+            return False
+        return True
+
+    def __relist(self, job):
+        # Lists again a job that is retried. It keeps its attempts and its
+        #  dependents.
+        self._mutex.lock()
+        if job.is_cancelled:
+            self.__finish(job, Cancelled())
+            self._cancelled.append(job)
+        else:
+            self._stopping = False
+            if self._tracer is not None:
+                self._tracer.enqueued(job)
+            self.__push(job)
+        self.__unlock()
+
+    def __discarded(self, job):
+        # Call with self._mutex locked
+        if self._blocked:
+            self._not_full.wakeAll()
+        if self._coalescing.get(job.coalesce_key) is job:
+            del self._coalescing[job.coalesce_key]
+        self.__finish(job, Cancelled())
+        self._cancelled.append(job)
+        if self._tracer is not None:
+            self._tracer.finish(job, Outcome.CANCELLED)
+
+    def __unlock(self):
+        # Unlocks self._mutex and fails the jobs discarded meanwhile (failed
+        #  is called with it unlocked)
+        cancelled = self._cancelled
+        self._cancelled = []
+        self._mutex.unlock()
+        for job in cancelled:
+            job.failed(job._failure)
+
+    def __wake_slave(self):
+        # Call with self._mutex locked
+        if self._idle_slaves:
+            self._idle_slaves.pop(0).wake()
+            self._reused += 1
+        elif len(self._slaves) < self._max_slaves:
+            slave = Slave(self)
+            self._slaves.append(slave)
+            self._spawned += 1
+            slave.start()
+
+    def __reap_slaves(self):
+        # Call with self._free_mutex locked
+        # Drops the retired slaves whose thread has finished. free_slave only
+        #  runs for the slaves started from the GUI thread: the finished
+        #  signal of the rest is queued to a thread without an event loop.
+        self._free_slaves = [
+            s for s in self._free_slaves if not s.isFinished()
+        ]
+
+    def __retire(self, slave):
+        # Call with self._mutex locked
+        # The slave will be free after this (no more jobs to be done).
+        # We can no longer use it but we have to keep an instance until
+        #  it is free to prevent the garbage collector to destroy it too
+        #  soon. So we move it to another list.
+        for i, s in enumerate(self._slaves):
+            if s is slave:
+                self._slaves.pop(i)
 
-        self._jobs.insert(i, job)
+                self._free_mutex.lock()
+                self.__reap_slaves()
+                self._free_slaves.append(slave)
+                self._free_mutex.unlock()
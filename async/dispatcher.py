@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+This script contains the class Dispatcher: applies the results of the jobs in
+the GUI thread.
+"""
+
+import sys
+import time
+from collections import deque
+from types import GeneratorType
+
+from PyQt5.QtCore import Qt, QObject, QMutex, QTimer, pyqtSignal
+
+from .tracer import Outcome
+
+
+class Dispatcher(QObject):
+    """
+    Applies the results of the finished jobs in the thread where it was made
+    (the GUI thread). Each time the event loop runs it, it only works for
+    frame_budget milliseconds and then lets the event loop process other
+    events (like painting) before continuing.
+    If Job.apply_result (or Job.exception_risen) is a generator, it is
+    advanced one step at a time, so a job can split a long update in chunks
+    by yielding between them.
+    The progress reported by the jobs is delivered before the results.
+    """
+    _posted = pyqtSignal()
+
+    def __init__(self, frame_budget=8):
+        """
+        Constructor.
+        :param frame_budget: Milliseconds of GUI time used each time the event
+        loop runs the dispatcher.
+        :type frame_budget:  float
+        """
+        super().__init__()
+        self.frame_budget = frame_budget
+        self.tracer = None
+
+        self._results = deque()
+        self._progress = {}
+        self._applying = None
+        self._scheduled = False
+        self._dispatching = False
+        self._mutex = QMutex()
+
+        self._posted.connect(self._dispatch, Qt.QueuedConnection)
+
+    def post(self, job, exception=None):
+        """
+        Queues the result of a job to be applied in the GUI thread. It can be
+        called from any thread.
+        :param job: The finished job.
+        :type job:  .async.Job
+        :param exception: Exception risen by the job, if it failed.
+        :type exception:  Exception or None
+        """
+        self._results.append((job, exception))
+        self.__schedule()
+
+    def post_progress(self, job, args):
+        """
+        Queues the progress of a job to be delivered in the GUI thread. If
+        the job already has a progress queued, it is replaced. It can be
+        called from any thread.
+        :param job: The job working.
+        :type job:  .async.Job
+        :param args: Arguments of job.progress_changed.
+        :type args:  tuple
+        """
+        self._mutex.lock()
+        self._progress[job] = args
+        self._mutex.unlock()
+        self.__schedule()
+
+    def _dispatch(self):
+        """
+        Applies results until the frame budget is spent. Called in the GUI
+        thread.
+        """
+        if self._dispatching:
+            # Called from a nested event loop (ie. a dialog opened while
+            #  applying a result). The outer call continues afterwards.
+            return
+        self._dispatching = True
+
+        self.__deliver_progress()
+
+        deadline = time.perf_counter() + self.frame_budget / 1000.0
+        while time.perf_counter() < deadline:
+            if self._applying is None:
+                if not self._results:
+                    break
+                self._applying = self.__start(*self._results.popleft())
+                if self._applying is None:
+                    continue
+
+            job, generator = self._applying
+            try:
+                next(generator)
+            except StopIteration:
+                self.__applied(job)
+            except Exception:
+                self.__applied(job)
+                sys.excepthook(*sys.exc_info())
+
+        self._dispatching = False
+
+        self._mutex.lock()
+        pending = self._applying is not None or len(self._results) > 0 or \
+            len(self._progress) > 0
+        self._scheduled = pending
+        self._mutex.unlock()
+
+        if pending:
+            # Let the event loop breathe before continuing
+            QTimer.singleShot(0, self._dispatch)
+
+    def __schedule(self):
+        self._mutex.lock()
+        schedule = not self._scheduled
+        self._scheduled = True
+        self._mutex.unlock()
+
+        if schedule:
+            self._posted.emit()
+
+    def __deliver_progress(self):
+        self._mutex.lock()
+        progress = self._progress
+        self._progress = {}
+        self._mutex.unlock()
+
+        for job, args in progress.items():
+            if job.is_cancelled:
+                continue
+            try:
+                job.progress_changed(*args)
+            except Exception:
+                sys.excepthook(*sys.exc_info())
+
+    def __start(self, job, exception):
+        # Returns the job and the generator of its result, or None if it was
+        #  applied at once.
+        tracer = self.tracer
+        if job.is_cancelled:
+            if tracer is not None:
+                tracer.finish(job, Outcome.CANCELLED)
+            return None
+
+        if tracer is not None:
+            tracer.apply_started(job)
+        try:
+            if exception is None:
+                result = job.apply_result()
+            else:
+                result = job.exception_risen(exception)
+        except Exception:
+            result = None
+            sys.excepthook(*sys.exc_info())
+
+        if isinstance(result, GeneratorType):
+            return job, result
+
+        if tracer is not None:
+            tracer.applied(job)
+        return None
+
+    def __applied(self, job):
+        self._applying = None
+        if self.tracer is not None:
+            self.tracer.applied(job)
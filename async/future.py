@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+This script contains the classes Future and FunctionJob: the result of a
+function submitted to a Company and the job that calls it.
+"""
+
+import concurrent.futures
+
+from .cancellation import Cancelled
+from .job import Job
+
+
+class Future(concurrent.futures.Future):
+    """
+    Result of a function submitted to a Company. It is a
+    concurrent.futures.Future, so it works with concurrent.futures.wait and
+    as_completed, but the done callbacks are called in the GUI thread (by the
+    company's dispatcher).
+    """
+    def __init__(self, company, job):
+        """
+        Constructor.
+        :param company: The company that works on the function.
+        :type company:  .async.Company
+        :param job: The job that calls the function.
+        :type job:  .async.FunctionJob
+        """
+        super().__init__()
+        self.company = company
+        self.job = job
+        self._gui_callbacks = []
+        self._delivered = False
+
+    def add_done_callback(self, fn):
+        """
+        Calls fn(future) in the GUI thread when the future is done. If it is
+        already done, it is called immediately. Call it from the GUI thread.
+        :param fn: Callback.
+        :type fn:  callable
+        """
+        if self._delivered:
+            fn(self)
+        else:
+            self._gui_callbacks.append(fn)
+
+    def cancel(self):
+        """
+        Cancels the future and its job, if it is not running or done yet.
+        Returns if it is cancelled.
+        """
+        cancelled = super().cancel()
+        if cancelled:
+            self.job.cancel()
+        return cancelled
+
+    def then(self, fn, *args, **kwargs):
+        """
+        Submits fn(result, *args, **kwargs) when this future finishes. It is
+        called from a slave without going through the GUI thread. If this
+        future fails or is cancelled, the returned one fails with the same
+        exception. The new job has the same lane and priority.
+        Returns the future of fn.
+        :param fn: Function that receives the result of this future.
+        :type fn:  callable
+        """
+        job = FunctionJob(
+            self.company,
+            _chain,
+            (self, fn, args, kwargs),
+            priority=self.job.priority,
+            lane=self.job.lane,
+        )
+        concurrent.futures.Future.add_done_callback(
+            self,
+            lambda f: self.company.list_job(job),
+        )
+        return job.future
+
+    def _deliver(self):
+        """
+        Calls the done callbacks. Called from the GUI thread.
+        """
+        self._delivered = True
+        callbacks = self._gui_callbacks
+        self._gui_callbacks = []
+        for callback in callbacks:
+            callback(self)
+
+
+class FunctionJob(Job):
+    """
+    Job that calls a function and keeps its result in a Future.
+    """
+    def __init__(self, company, fn, args=(), kwargs=None,
+                 priority=0.0, lane=None):
+        """
+        Contructor.
+        :param company: The company where the job is going to be listed.
+        :type company:  .async.Company
+        :param fn: Function to call in the slave.
+        :type fn:  callable
+        :param args: Positional arguments of fn.
+        :type args:  tuple
+        :param kwargs: Keyword arguments of fn.
+        :type kwargs:  dict
+        :param priority: Priority of the job.
+        :type priority:  float
+        :param lane: Lane of the job.
+        :type lane:  str or None
+        """
+        super().__init__(priority=priority, lane=lane)
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.future = Future(company, self)
+
+    def do_work(self):
+        """
+        Calls the function, unless the future was cancelled.
+        :raises concurrent.futures.CancelledError: if the future was
+        cancelled.
+        """
+        if not self.future.running():
+            if not self.future.set_running_or_notify_cancel():
+                raise concurrent.futures.CancelledError()
+
+        self.future.set_result(self.fn(*self.args, **self.kwargs))
+
+    def failed(self, exception):
+        """
+        Fails the future with the exception. If the job was cancelled, the
+        future is cancelled (or fails with CancelledError if it was running)
+        and its done callbacks are called, although the job's result is not
+        applied.
+        """
+        if isinstance(exception, Cancelled):
+            if not self.future.cancel() and not self.future.done():
+                self.future.set_exception(
+                    concurrent.futures.CancelledError()
+                )
+            self.future.company.dispatcher.post(_Delivery(self.future))
+            return
+
+        if self.future.done():
+            return
+        if self.future.running() or \
+                self.future.set_running_or_notify_cancel():
+            self.future.set_exception(exception)
+
+    def apply_result(self):
+        """
+        Calls the done callbacks of the future.
+        """
+        self.future._deliver()
+
+    def exception_risen(self, exception):
+        """
+        Calls the done callbacks of the future.
+        """
+        self.future._deliver()
+
+
+class _Delivery(Job):
+    # Calls the done callbacks of the future of a cancelled job. It is not
+    #  worked on, it is posted directly to the dispatcher (which doesn't
+    #  apply the results of cancelled jobs).
+    def __init__(self, future):
+        super().__init__()
+        self.future = future
+
+    def apply_result(self):
+        self.future._deliver()
+
+
+def _chain(future, fn, args, kwargs):
+    return fn(future.result(), *args, **kwargs)
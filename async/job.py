@@ -1,24 +1,173 @@
 # -*- coding: utf-8 -*-
 """
-This script contains the class Job.
+This script contains the classes Job and Priority.
 """
 
+import time
+
+from .cancellation import CancellationToken
+
+
+class Priority:
+    """
+    Priority classes of the jobs. Interactive jobs (the user is waiting for
+    them) are always taken before the rest and may preempt background jobs
+    (see Job.yield_point). Any other float is a valid priority too.
+    """
+    BACKGROUND = -10.0
+    NORMAL = 0.0
+    INTERACTIVE = 10.0
+
+
+class DependencyFailed(Exception):
+    """
+    A job the failed job depends on failed or was cancelled.
+    """
+    def __init__(self, job, exception):
+        """
+        Constructor.
+        :param job: The job that failed.
+        :type job:  .async.Job
+        :param exception: The exception of the failed job.
+        :type exception:  Exception
+        """
+        super().__init__(job, exception)
+        self.job = job
+        self.exception = exception
+
 
 class Job:
     """
     Represents a job to be done. Override this class to do your own job.
     """
-    def __init__(self, priority=0.0):
+    def __init__(self, priority=Priority.NORMAL, lane=None, coalesce_key=None,
+                 token=None, depends_on=None, retry=None, deadline=None):
         """
         Contructor.
-        :param priority: Priority of the job.
+        :param priority: Priority of the job (see Priority). Jobs of
+        Priority.INTERACTIVE or higher are taken before any other.
         :type priority:  float
+        :param lane: Name of the company's lane the job is listed in. None
+        lists it in the default lane.
+        :type lane:  str or None
+        :param coalesce_key: Jobs with the same key do the same work. If a job
+        with the same key is already listed, it is merged into it (see merge)
+        instead of being listed twice. None never merges.
+        :type coalesce_key:  hashable or None
+        :param token: Token that cancels this job. A new one is made if None.
+        :type token:  .async.CancellationToken
+        :param depends_on: Jobs that must finish successfully before this one
+        is worked on. If any of them fails, this one fails with
+        DependencyFailed.
+        :type depends_on:  list of .async.Job
+        :param retry: When and how to retry the job if it fails. None never
+        retries.
+        :type retry:  .async.RetryPolicy
+        :param deadline: Seconds each attempt may take. It is not enforced by
+        the company: the job (or the company's job_context) must check
+        time_left. None for no deadline.
+        :type deadline:  float or None
         """
         self.priority = priority
+        self.lane = lane
+        self.coalesce_key = coalesce_key
+        self.token = token if token is not None else CancellationToken()
+        self.depends_on = list(depends_on or [])
+        self.retry = retry
+        self.deadline = deadline
+        self.attempt = 0
+
+        # Dependency state, managed by the company
+        self._dependents = []
+        self._waiting = 0
+        self._finished = False
+        self._failure = None
+        self._dependency_error = None
+        # Jobs merged into this one, which finish with it
+        self._merged = []
+
+        # Lifecycle timestamps, only when the company is tracing
+        self._trace = None
+
+        # Slave working on the job and when its attempt is due (monotonic),
+        #  set by the slave
+        self._slave = None
+        self._due = None
+
+    @property
+    def is_interactive(self):
+        """
+        Is the job of the interactive priority class?
+        """
+        return self.priority >= Priority.INTERACTIVE
+
+    @property
+    def time_left(self):
+        """
+        Seconds left until the deadline of the current attempt (it may be
+        negative), or None if it has no deadline or it is not being worked
+        on.
+        """
+        if self._due is None:
+            return None
+        return self._due - time.monotonic()
+
+    @property
+    def timed_out(self):
+        """
+        Has the deadline of the current (or last) attempt expired?
+        """
+        left = self.time_left
+        return left is not None and left <= 0
+
+    @property
+    def is_cancelled(self):
+        """
+        Has the job been cancelled?
+        """
+        return self.token.is_cancelled
+
+    def cancel(self):
+        """
+        Cancels the job (and all the jobs sharing its token). If it is listed
+        it will not be worked on and its results are not applied.
+        """
+        self.token.cancel()
 
     def do_work(self):
         """
         Do the asynchronous job.
+        Long jobs should call self.yield_point() (or
+        self.token.raise_if_cancelled()) from time to time.
+        """
+        pass
+
+    def yield_point(self):
+        """
+        Checks if the job has been cancelled and, if it is not interactive,
+        lets its slave work on the interactive jobs that are waiting for a
+        free slave before continuing. Meant to be called from do_work.
+        :raises Cancelled: if it has been cancelled.
+        """
+        self.token.raise_if_cancelled()
+        if self._slave is not None and not self.is_interactive:
+            self._slave.preempt(self)
+            self.token.raise_if_cancelled()
+
+    def report_progress(self, *args):
+        """
+        Reports the progress of the job, which is passed to progress_changed
+        in the GUI thread. Only the last progress reported before the GUI
+        thread gets to it is delivered, so it can be called very often.
+        Meant to be called from do_work.
+        """
+        if self._slave is not None:
+            self._slave.company.dispatcher.post_progress(self, args)
+
+    def progress_changed(self, *args):
+        """
+        Shows the progress reported by do_work (see report_progress). Called
+        in the GUI thread, unless the job has been cancelled.
         """
         pass
 
@@ -26,6 +175,8 @@ class Job:
         """
         Apply the results after the asynchronous job has been done.
         Normally used to update GUI.
+        It may be a generator: long updates can yield between chunks so the
+        GUI is not frozen while they are applied.
         """
         pass
 
@@ -34,3 +185,26 @@ class Job:
         There was an error during the asynchronous execution.
         """
         raise exception
+
+    def failed(self, exception):
+        """
+        Called in the slave when the job fails for good: it is not going to
+        be retried. It is also called, instead of do_work, when a job this
+        one depends on failed, and with Cancelled when it is discarded
+        because it was cancelled while listed (then from the thread that
+        discarded it). exception_risen is called afterwards in the GUI thread
+        (unless it was cancelled).
+        :param exception: The error.
+        :type exception:  Exception
+        """
+        pass
+
+    def merge(self, job):
+        """
+        Merges a job with the same coalesce_key into this one, which is still
+        listed. The merged job is not worked on. Override it to keep the
+        callbacks of the merged job.
+        :param job: Job that is merged.
+        :type job:  .async.Job
+        """
+        pass
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+This script contains the class JobQueue: the pending jobs of a Company sorted
+by priority.
+"""
+
+import heapq
+import time
+from itertools import count
+
+
+class JobQueue:
+    """
+    Priority queue of jobs. Interactive jobs (see Job.is_interactive) are
+    taken before the rest. Then the job with the highest priority is taken
+    first and jobs with the same priority are taken in the order they were
+    pushed. Both operations are O(log n).
+    With aging, the priority of a job grows while it waits, so low priority
+    jobs are not starved by a steady stream of higher priority ones. It is
+    applied by subtracting the aging of the push time from the priority,
+    which keeps the order of the jobs that are already in the heap.
+    Cancelled jobs are discarded when they reach the top of the queue, until
+    then they are still counted by len.
+    This class is not thread safe, the Company protects it with its mutex.
+    """
+    def __init__(self, sequence=None, discarded=None, aging=0.0):
+        """
+        Constructor.
+        :param sequence: Iterator that gives the sequence numbers used to keep
+        the order of the jobs with the same priority. Queues sharing it keep
+        a common order.
+        :type sequence:  iterator
+        :param discarded: Called with each cancelled job that is discarded.
+        :type discarded:  callable
+        :param aging: Priority gained by a job for each second it waits.
+        Queues whose keys are compared must use the same aging.
+        :type aging:  float
+        """
+        self._heap = []
+        self._sequence = sequence if sequence is not None else count()
+        self._discarded = discarded
+        self.aging = aging
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, job):
+        """
+        Adds a job to the queue.
+        :param job: Job to be added.
+        :type job:  .async.Job
+        """
+        priority = job.priority
+        if self.aging:
+            priority -= self.aging * time.monotonic()
+        heapq.heappush(
+            self._heap,
+            (not job.is_interactive, -priority, next(self._sequence), job),
+        )
+
+    def pop(self):
+        """
+        Removes and returns the job with the highest priority (the first
+        pushed if there are several). Returns None if the queue is empty.
+        """
+        self.__discard_cancelled()
+        if not self._heap:
+            return None
+        return heapq.heappop(self._heap)[-1]
+
+    def key(self):
+        """
+        Returns the sort key of the job that would be popped next (lower is
+        popped first). Returns None if the queue is empty.
+        """
+        self.__discard_cancelled()
+        if not self._heap:
+            return None
+        return self._heap[0][:-1]
+
+    def peek(self):
+        """
+        Returns the job that would be popped next without removing it. Returns
+        None if the queue is empty.
+        """
+        self.__discard_cancelled()
+        if not self._heap:
+            return None
+        return self._heap[0][-1]
+
+    def pop_oldest(self):
+        """
+        Removes and returns the job that was pushed first. Returns None if
+        the queue is empty. It is O(n).
+        """
+        if not self._heap:
+            return None
+        i = min(range(len(self._heap)), key=lambda i: self._heap[i][-2])
+        job = self._heap[i][-1]
+        self._heap[i] = self._heap[-1]
+        self._heap.pop()
+        heapq.heapify(self._heap)
+        return job
+
+    def __discard_cancelled(self):
+        while self._heap and self._heap[0][-1].is_cancelled:
+            job = heapq.heappop(self._heap)[-1]
+            if self._discarded is not None:
+                self._discarded(job)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+This script contains the class Lane: a group of jobs of a Company with its
+own concurrency limit and queue bound.
+"""
+
+from .job_queue import JobQueue
+
+
+class QueueFull(Exception):
+    """
+    A job was rejected, or dropped, because its lane had too many listed
+    jobs.
+    """
+    def __init__(self, lane):
+        """
+        Constructor.
+        :param lane: Name of the lane.
+        :type lane:  str
+        """
+        super().__init__(lane)
+        self.lane = lane
+
+
+class Overflow:
+    """
+    What listing a job in a full lane does.
+    """
+    # Wait until a listed job is taken
+    BLOCK = 'block'
+    # Raise QueueFull
+    REJECT = 'reject'
+    # List it and drop the oldest listed job of the lane, whatever its
+    #  coalesce_key, which fails with QueueFull. A job with the same
+    #  coalesce_key as a listed one is merged into it before the lane is
+    #  checked, so there is never an older job with its key to drop instead.
+    #  Meant for lanes whose jobs can be lost, e.g. periodic refreshes: the
+    #  jobs that must not be lost (like the uploads) go to BLOCK or REJECT
+    #  lanes
+    DROP_OLDEST = 'drop_oldest'
+
+
+class Lane:
+    """
+    Jobs listed in the same lane of a Company. At most max_slaves of them are
+    worked on at the same time and at most max_jobs of them are listed.
+    This class is not thread safe, the Company protects it with its mutex.
+    """
+    def __init__(self, name, max_slaves, sequence=None, discarded=None,
+                 aging=0.0, max_jobs=None, overflow=Overflow.BLOCK,
+                 block_timeout=None):
+        """
+        Constructor.
+        :param name: Name of the lane.
+        :type name:  str
+        :param max_slaves: Maximum number of jobs of this lane that may be
+        worked on at the same time. None for no limit.
+        :type max_slaves:  int or None
+        :param sequence: Sequence shared by the queues of the company.
+        :type sequence:  iterator
+        :param discarded: Called with each cancelled job that is discarded.
+        :type discarded:  callable
+        :param aging: Priority gained by a job for each second it waits.
+        :type aging:  float
+        :param max_jobs: Maximum number of listed jobs (cancelled jobs count
+        until they are discarded). None for no limit.
+        :type max_jobs:  int or None
+        :param overflow: What listing a job does when the lane is full (see
+        Overflow).
+        :type overflow:  str
+        :param block_timeout: Milliseconds a blocked producer waits before
+        the job is rejected. None waits forever.
+        :type block_timeout:  int or None
+        """
+        self.name = name
+        self.max_slaves = max_slaves
+        self.max_jobs = max_jobs
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.jobs = JobQueue(sequence, discarded, aging)
+        self.working = 0
+
+    @property
+    def available(self):
+        """
+        Can a job of this lane be started now?
+        """
+        return self.jobs.peek() is not None and (
+            self.max_slaves is None or self.working < self.max_slaves
+        )
+
+    @property
+    def full(self):
+        """
+        Has this lane reached its maximum number of listed jobs?
+        """
+        return self.max_jobs is not None and len(self.jobs) >= self.max_jobs
+
+    @property
+    def idle(self):
+        """
+        Has this lane neither listed jobs nor jobs being worked on?
+        """
+        return self.jobs.peek() is None and self.working == 0
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+This script contains the class RetryPolicy: when and how long to wait before
+trying a failed job again.
+"""
+
+import random
+
+
+class RetryPolicy:
+    """
+    Retries a failed job with exponential backoff and jitter. The delay
+    before the attempt n+1 is min(cap, base * 2 ** (n - 1)) seconds, reduced
+    by a random fraction of up to jitter of it.
+    """
+    def __init__(self, max_attempts=3, base=0.5, cap=30.0, jitter=1.0,
+                 retryable=Exception):
+        """
+        Constructor.
+        :param max_attempts: Maximum number of times the job is worked on
+        (including the first one).
+        :type max_attempts:  int
+        :param base: Seconds to wait before the first retry (without jitter).
+        :type base:  float
+        :param cap: Maximum seconds to wait between two attempts.
+        :type cap:  float
+        :param jitter: Fraction (from 0 to 1) of the delay that is random.
+        1 spreads the retries between 0 and the delay.
+        :type jitter:  float
+        :param retryable: Exception classes that can be retried or a function
+        that tells if an exception can be retried.
+        :type retryable:  type, tuple of types or callable
+        """
+        self.max_attempts = max_attempts
+        self.base = base
+        self.cap = cap
+        self.jitter = jitter
+        self.retryable = retryable
+
+    def should_retry(self, exception, attempt):
+        """
+        Returns if the job should be tried again.
+        :param exception: The exception of the last attempt.
+        :type exception:  Exception
+        :param attempt: Number of attempts done.
+        :type attempt:  int
+        """
+        if attempt >= self.max_attempts:
+            return False
+        if isinstance(self.retryable, type) or \
+                isinstance(self.retryable, tuple):
+            return isinstance(exception, self.retryable)
+        return self.retryable(exception)
+
+    def delay(self, attempt):
+        """
+        Returns the seconds to wait before the next attempt.
+        :param attempt: Number of attempts done.
+        :type attempt:  int
+        """
+        delay = min(self.cap, self.base * 2 ** (attempt - 1))
+        return delay * (1.0 - self.jitter * random.random())
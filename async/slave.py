@@ -4,38 +4,33 @@ This script contains the class Slave: it the jobs on the list in its own
 thread.
 """
 
-from PyQt5.QtCore import Qt, pyqtSignal, QThread
+import time
 
-from .job import Job
+from PyQt5.QtCore import QThread, QWaitCondition
+
+from .cancellation import Cancelled
 
 
 class Slave(QThread):
     """
-    Performs jobs. It's its own thread.
+    Performs jobs. It's its own thread. It keeps asking the company for jobs
+    until it tells it to finish. The results are applied by the company's
+    dispatcher.
     """
-    _job_done = pyqtSignal(Job)
-    _exception_risen = pyqtSignal(Job, Exception)
 
-    def __init__(self, company, job):
+    def __init__(self, company, job=None):
         """
         Constructor.
         :param company: The company that gives the jobs to be made.
         :type company:  .async.Company
-        :param job: An inital job to be done.
+        :param job: An inital job to be done. If None, it asks the company.
         :type job:  .async.Job
         """
 
         super(Slave, self).__init__()
         self.company = company
         self.job = job
-
-        def apply_job_result(j):
-            j.apply_result()
-        self._job_done.connect(apply_job_result, Qt.QueuedConnection)
-
-        def exception_risen(j, e):
-            j.exception_risen(e)
-        self._exception_risen.connect(exception_risen, Qt.QueuedConnection)
+        self._job_available = QWaitCondition()
 
         self.finished.connect(lambda: company.free_slave(self))
 
@@ -43,16 +38,70 @@ class Slave(QThread):
         """
         Start working.
         """
-        if self.job is None:
-            return
-
         while True:
-            try:
-                self.job.do_work()
-                self._job_done.emit(self.job)
-            except Exception as e:
-                self._exception_risen.emit(self.job, e)
-
-            self.job = self.company._aquire_job(self)
             if self.job is None:
+                self.job = self.company._aquire_job(self)
+                if self.job is None:
+                    return
+
+            self.__work(self.job)
+            self.job = None
+
+    def preempt(self, job):
+        """
+        Works on the interactive jobs that are waiting for a slave, if any,
+        before continuing with job. Called from job (see Job.yield_point).
+        :param job: The job being worked on by this slave.
+        :type job:  .async.Job
+        """
+        while True:
+            interactive = self.company._preempt(job)
+            if interactive is None:
                 return
+            self.__work(interactive)
+
+    def __work(self, job):
+        failure = None
+        job._slave = self
+        try:
+            if job._dependency_error is not None:
+                raise job._dependency_error
+
+            job.attempt += 1
+            if job.deadline is not None:
+                job._due = time.monotonic() + job.deadline
+            context = self.company.job_context
+            if context is None:
+                job.do_work()
+            else:
+                with context(job):
+                    job.do_work()
+            if job.is_cancelled:
+                raise Cancelled()
+        except Exception as e:
+            failure = e
+        job._slave = None
+
+        retrying = self.company._job_finished(job, failure)
+        if failure is None:
+            self.company.dispatcher.post(job)
+        elif not retrying:
+            job.failed(failure)
+            if not isinstance(failure, Cancelled):
+                self.company.dispatcher.post(job, failure)
+
+    def wait_for_job(self, mutex, timeout):
+        """
+        Waits (idle) until wake is called or timeout milliseconds pass.
+        :param mutex: Locked mutex that is released while waiting.
+        :type mutex:  PyQt5.QtCore.QMutex
+        :param timeout: Milliseconds to wait.
+        :type timeout:  int
+        """
+        return self._job_available.wait(mutex, timeout)
+
+    def wake(self):
+        """
+        Wakes up the slave if it is waiting for a job.
+        """
+        self._job_available.wakeOne()
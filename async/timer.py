@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+This script contains the class Timer: a single thread that calls functions
+after a delay or periodically.
+"""
+
+import heapq
+import random
+import sys
+import time
+from itertools import count
+
+from PyQt5.QtCore import QMutex, QThread, QWaitCondition
+
+
+class TimerHandle:
+    """
+    A function scheduled in a Timer. Allows to cancel it.
+    """
+    def __init__(self, fn, due, interval=None, jitter=0.0):
+        self.fn = fn
+        self.due = due
+        self.interval = interval
+        self.jitter = jitter
+        self._cancelled = False
+
+    @property
+    def is_cancelled(self):
+        """
+        Has it been cancelled?
+        """
+        return self._cancelled
+
+    def cancel(self):
+        """
+        Cancels the next calls of the function.
+        """
+        self._cancelled = True
+
+    def _next_due(self, now):
+        # Next time of a periodic function. It doesn't drift unless the timer
+        #  is late by more than an interval.
+        interval = self.interval * (
+            1.0 + random.uniform(-self.jitter, self.jitter)
+        )
+        return max(self.due + interval, now)
+
+
+class Timer(QThread):
+    """
+    Calls functions in its own thread when they are due. The pending calls
+    are kept in a heap, so scheduling and cancelling are O(log n) (cancelled
+    calls are discarded when they are due). The functions should be short
+    (ie. list a job), they delay the other calls.
+    """
+    def __init__(self):
+        """
+        Constructor.
+        """
+        super().__init__()
+        self._heap = []
+        self._sequence = count()
+        self._stopping = False
+        self._mutex = QMutex()
+        self._changed = QWaitCondition()
+
+    def call_later(self, delay, fn):
+        """
+        Calls fn() after delay seconds. Returns its TimerHandle.
+        :param delay: Seconds to wait.
+        :type delay:  float
+        :param fn: Function to call.
+        :type fn:  callable
+        """
+        return self.__add(TimerHandle(fn, time.monotonic() + delay))
+
+    def call_every(self, interval, fn, jitter=0.0, delay=None):
+        """
+        Calls fn() every interval seconds. Returns its TimerHandle.
+        :param interval: Seconds between two calls.
+        :type interval:  float
+        :param fn: Function to call.
+        :type fn:  callable
+        :param jitter: Fraction of the interval that is added or subtracted
+        randomly to each interval.
+        :type jitter:  float
+        :param delay: Seconds to wait before the first call. The interval if
+        None.
+        :type delay:  float or None
+        """
+        if delay is None:
+            delay = interval
+        return self.__add(TimerHandle(
+            fn,
+            time.monotonic() + delay,
+            interval,
+            jitter,
+        ))
+
+    def stop(self):
+        """
+        Cancels all the pending calls and finishes the thread.
+        """
+        self._mutex.lock()
+        self._stopping = True
+        self._heap = []
+        self._changed.wakeAll()
+        self._mutex.unlock()
+
+    def run(self):
+        """
+        Calls the functions when they are due.
+        """
+        self._mutex.lock()
+        while not self._stopping:
+            if not self._heap:
+                self._changed.wait(self._mutex)
+                continue
+
+            due, _, handle = self._heap[0]
+            if handle.is_cancelled:
+                heapq.heappop(self._heap)
+                continue
+
+            now = time.monotonic()
+            if due > now:
+                self._changed.wait(self._mutex, int((due - now) * 1000) + 1)
+                continue
+
+            heapq.heappop(self._heap)
+            if handle.interval is not None:
+                handle.due = handle._next_due(now)
+                self.__push(handle)
+
+            self._mutex.unlock()
+            try:
+                handle.fn()
+            except Exception:
+                sys.excepthook(*sys.exc_info())
+            self._mutex.lock()
+        self._mutex.unlock()
+
+    def __add(self, handle):
+        self._mutex.lock()
+        if self._stopping:
+            # Let the stopped thread finish before starting it again
+            self._mutex.unlock()
+            self.wait()
+            self._mutex.lock()
+            self._stopping = False
+        self.__push(handle)
+        self._changed.wakeAll()
+        self._mutex.unlock()
+
+        if not self.isRunning():
+            self.start()
+        return handle
+
+    def __push(self, handle):
+        # Call with self._mutex locked
+        heapq.heappush(
+            self._heap,
+            (handle.due, next(self._sequence), handle),
+        )
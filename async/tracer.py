@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+This script contains the class Tracer: records the lifecycle of the jobs of a
+Company and exports it as a Chrome trace (chrome://tracing, Perfetto).
+"""
+
+import json
+import threading
+import time
+from collections import deque
+
+
+class Outcome:
+    """
+    How a traced job ended.
+    """
+    DONE = 'done'
+    FAILED = 'failed'
+    TIMED_OUT = 'timed_out'
+    CANCELLED = 'cancelled'
+    DROPPED = 'dropped'
+    RETRIED = 'retried'
+
+
+class JobTrace:
+    """
+    Timestamps (seconds, time.perf_counter) of a single job.
+    """
+    def __init__(self, job, enqueued):
+        self.name = type(job).__name__
+        self.lane = job.lane
+        self.priority = job.priority
+        self.enqueued = enqueued
+        self.started = None
+        self.work_finished = None
+        self.apply_started = None
+        self.applied = None
+        self.thread = None
+        self.outcome = None
+
+    @property
+    def queue_wait(self):
+        """
+        Seconds the job was listed before a slave took it.
+        """
+        if self.started is None:
+            return None
+        return self.started - self.enqueued
+
+    @property
+    def run_time(self):
+        """
+        Seconds a slave worked on the job.
+        """
+        if self.work_finished is None:
+            return None
+        return self.work_finished - self.started
+
+    @property
+    def apply_time(self):
+        """
+        Seconds from the first to the last chunk of the result applied in the
+        GUI thread.
+        """
+        if self.applied is None:
+            return None
+        return self.applied - self.apply_started
+
+
+class Histogram:
+    """
+    Histogram of durations with fixed buckets (in milliseconds).
+    """
+    BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        """
+        Adds a duration.
+        :param seconds: The duration.
+        :type seconds:  float
+        """
+        ms = seconds * 1000.0
+        i = 0
+        while i < len(self.BUCKETS) and ms > self.BUCKETS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, p):
+        """
+        Returns the upper bound (ms) of the bucket containing the p
+        percentile, or the maximum if it is in the last bucket.
+        :param p: Percentile, from 0 to 100.
+        :type p:  float
+        """
+        if self.count == 0:
+            return None
+        target = self.count * p / 100.0
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target and c > 0:
+                break
+        if i < len(self.BUCKETS):
+            return min(self.BUCKETS[i], self.max)
+        return self.max
+
+    def to_dict(self):
+        """
+        Returns a JSON serializable summary.
+        """
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count if self.count else None,
+            'max_ms': self.max,
+            'p50_ms': self.percentile(50),
+            'p90_ms': self.percentile(90),
+            'p99_ms': self.percentile(99),
+            'buckets_ms': list(self.BUCKETS) + ['inf'],
+            'counts': list(self.counts),
+        }
+
+
+class Tracer:
+    """
+    Records when each job is listed, started, finished and applied, and keeps
+    histograms of the queue wait, run and apply times.
+    The company only calls it when tracing is enabled.
+    """
+    def __init__(self, max_traces=10000):
+        """
+        Constructor.
+        :param max_traces: Number of finished jobs kept for the export.
+        :type max_traces:  int
+        """
+        self._origin = time.perf_counter()
+        self._gui_thread = threading.get_ident()
+        self._traces = deque(maxlen=max_traces)
+        self._lock = threading.Lock()
+        self.histograms = {
+            'queue_wait': Histogram(),
+            'run': Histogram(),
+            'apply': Histogram(),
+        }
+        self.outcomes = {}
+
+    def enqueued(self, job):
+        """
+        The job has been listed.
+        """
+        job._trace = JobTrace(job, time.perf_counter())
+
+    def started(self, job):
+        """
+        A slave took the job. Called from the slave.
+        """
+        trace = job._trace
+        if trace is not None:
+            trace.started = time.perf_counter()
+            trace.thread = threading.get_ident()
+
+    def work_finished(self, job, failure):
+        """
+        The slave finished working on the job. Called from the slave.
+        """
+        trace = job._trace
+        if trace is not None:
+            trace.work_finished = time.perf_counter()
+            if failure is None:
+                trace.outcome = Outcome.DONE
+            elif job.timed_out:
+                trace.outcome = Outcome.TIMED_OUT
+            else:
+                trace.outcome = Outcome.FAILED
+
+    def apply_started(self, job):
+        """
+        The GUI thread started applying the result.
+        """
+        trace = job._trace
+        if trace is not None:
+            trace.apply_started = time.perf_counter()
+
+    def applied(self, job):
+        """
+        The GUI thread finished applying the result.
+        """
+        trace = job._trace
+        if trace is not None:
+            trace.applied = time.perf_counter()
+            self.finish(job, trace.outcome)
+
+    def finish(self, job, outcome):
+        """
+        The job will not be traced any more.
+        :param outcome: How it ended (see Outcome).
+        :type outcome:  str
+        """
+        trace = job._trace
+        if trace is None:
+            return
+        job._trace = None
+        trace.outcome = outcome
+
+        with self._lock:
+            self._traces.append(trace)
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            for name, value in (
+                    ('queue_wait', trace.queue_wait),
+                    ('run', trace.run_time),
+                    ('apply', trace.apply_time)):
+                if value is not None:
+                    self.histograms[name].add(value)
+
+    def summary(self):
+        """
+        Returns a JSON serializable summary of the histograms and outcomes.
+        """
+        with self._lock:
+            return {
+                'histograms': {
+                    name: h.to_dict() for name, h in self.histograms.items()
+                },
+                'outcomes': dict(self.outcomes),
+            }
+
+    def chrome_trace(self):
+        """
+        Returns the traced jobs in the Chrome trace event format.
+        """
+        with self._lock:
+            traces = list(self._traces)
+
+        events = [
+            self.__thread_name(0, 'Queue'),
+            self.__thread_name(self._gui_thread, 'GUI'),
+        ]
+        slave_threads = set()
+        for trace in traces:
+            args = {
+                'lane': str(trace.lane),
+                'priority': trace.priority,
+                'outcome': trace.outcome,
+            }
+            if trace.started is not None:
+                events.append(self.__event(
+                    trace.name, 'queue', 0,
+                    trace.enqueued, trace.started, args))
+            if trace.work_finished is not None:
+                slave_threads.add(trace.thread)
+                events.append(self.__event(
+                    trace.name, 'run', trace.thread,
+                    trace.started, trace.work_finished, args))
+            if trace.applied is not None:
+                events.append(self.__event(
+                    trace.name, 'apply', self._gui_thread,
+                    trace.apply_started, trace.applied, args))
+
+        for i, thread in enumerate(sorted(slave_threads)):
+            events.append(self.__thread_name(thread, 'Slave {}'.format(i)))
+
+        return {
+            'traceEvents': events,
+            'displayTimeUnit': 'ms',
+            'otherData': self.summary(),
+        }
+
+    def export(self, path):
+        """
+        Writes the Chrome trace to a JSON file.
+        :param path: Path of the file.
+        :type path:  str
+        """
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+    def __event(self, name, category, thread, start, end, args):
+        return {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'pid': 1,
+            'tid': thread,
+            'ts': (start - self._origin) * 1e6,
+            'dur': (end - start) * 1e6,
+            'args': args,
+        }
+
+    @staticmethod
+    def __thread_name(thread, name):
+        return {
+            'name': 'thread_name',
+            'ph': 'M',
+            'pid': 1,
+            'tid': thread,
+            'args': {'name': name},
+        }
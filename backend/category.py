@@ -1,7 +1,5 @@
 #!/usr/bin/env python
 
-import requests
-
 from .constants import Api
 from .utils import urljoin
 
@@ -30,7 +28,7 @@ class CategoryApi:
         return categories
 
     def _get_categories(self):
-        return requests.get(
+        return self.giscube.session.get(
             urljoin(
                 self.giscube.server_url,
                 Api.PATH,
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Compression of the request bodies and statistics of the bytes transferred.
+"""
+
+import tempfile
+import threading
+import zlib
+
+from .constants import Compression, Http
+
+
+class TransferStats:
+    """
+    Counts the bytes of the payloads sent to and received from a server, on
+    the wire and before (or after) compression, to know how much the
+    compression saves.
+    It is thread safe.
+    """
+    def __init__(self):
+        """
+        Constructor.
+        """
+        self.sent = 0
+        self.sent_content = 0
+        self.received = 0
+        self.received_content = 0
+        self._lock = threading.Lock()
+
+    def add_sent(self, wire, content):
+        """
+        A payload has been sent.
+        :param wire: Bytes sent (compressed, if it was).
+        :type wire: int
+        :param content: Bytes of the payload.
+        :type content: int
+        """
+        with self._lock:
+            self.sent += wire
+            self.sent_content += content
+
+    def add_received(self, wire, content):
+        """
+        A payload has been received.
+        :param wire: Bytes received (compressed, if it was).
+        :type wire: int
+        :param content: Bytes of the payload.
+        :type content: int
+        """
+        with self._lock:
+            self.received += wire
+            self.received_content += content
+
+    @property
+    def saved(self):
+        """
+        Bytes that were not transferred thanks to the compression.
+        """
+        with self._lock:
+            return self.sent_content - self.sent + \
+                self.received_content - self.received
+
+
+class CompressedBody:
+    """
+    A request body compressed with gzip (Content-Encoding: gzip). The body is
+    compressed in chunks into a temporary file, that is only kept in memory
+    while it is small, so it is sent with a Content-Length without holding
+    it all in memory.
+    """
+    ENCODING = 'gzip'
+
+    def __init__(self, body, progress=None, level=Compression.LEVEL):
+        """
+        Constructor. Compresses the body.
+        :param body: The body to compress.
+        :type body: file-like object
+        :param progress: Called with the bytes sent so far and the length of
+        the compressed body each time a chunk is read.
+        :type progress: callable or None
+        :param level: zlib compression level.
+        :type level: int
+        """
+        self.progress = progress
+        self.sent = 0
+
+        self.__file = tempfile.SpooledTemporaryFile(Compression.SPOOL_SIZE)
+        # wbits 31: gzip header and trailer
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        while True:
+            chunk = body.read(Http.CHUNK_SIZE)
+            if not chunk:
+                break
+            self.__file.write(compressor.compress(chunk))
+        self.__file.write(compressor.flush())
+        self.__length = self.__file.tell()
+        self.__file.seek(0)
+
+    def __len__(self):
+        return self.__length
+
+    def __iter__(self):
+        # requests only streams the bodies that are iterable
+        while True:
+            chunk = self.read(Http.CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self, size=-1):
+        """
+        Reads the next size bytes of the compressed body (all the rest if
+        negative). Returns b'' at the end.
+        :param size: Maximum number of bytes.
+        :type size: int
+        """
+        data = self.__file.read(size)
+        self.sent += len(data)
+        if data and self.progress is not None:
+            self.progress(self.sent, self.__length)
+        return data
+
+    def close(self):
+        """
+        Removes the temporary file.
+        """
+        self.__file.close()
@@ -11,6 +11,9 @@ class OAuth:
     PATH = '/o/token'
     ADMIN_WEBSIDE = '/admin'
     UNAUTHORIZED = 401
+    # Seconds before the access token expires when the requests refresh it
+    #  before being made
+    REFRESH_MARGIN = 60
 
 
 class Api:
@@ -23,6 +26,56 @@ class Api:
     DISABLE_PUBLICATION = '/disable'
     CATEGORY = '/giscube/category'
     UNAUTHORIZED = 401
+    TOO_MANY_REQUESTS = 429
+    SERVER_ERRORS = range(500, 600)
+
+
+class Http:
+    """
+    Contains the HTTP connection pool and timeout constants.
+    """
+    POOL_CONNECTIONS = 4
+    POOL_MAXSIZE = 4
+    # A request never waits for a pooled connection (requests can't bound
+    #  the wait): if they are all in use it opens one that is not kept. The
+    #  lanes of the company already limit the concurrent requests
+    POOL_BLOCK = False
+    # Default seconds to connect and between the bytes received
+    CONNECT_TIMEOUT = 10
+    READ_TIMEOUT = 60
+    # Bytes read at once from the streamed responses
+    CHUNK_SIZE = 64 * 1024
+
+
+class Compression:
+    """
+    Contains the request compression constants.
+    """
+    # zlib compression level of the request bodies
+    LEVEL = 6
+    # Smaller bodies are sent uncompressed
+    MIN_SIZE = 1024
+    # Compressed bodies bigger than this are kept in a temporary file
+    SPOOL_SIZE = 1024 * 1024
+    # Status codes of a server that doesn't accept compressed requests: 415
+    #  (Unsupported Media Type), or 400 and 401 when it can't read the body.
+    #  The upload is sent again uncompressed, and compression is only turned
+    #  off if that one is accepted
+    REJECTED = (400, 401, 415)
+
+
+class Health:
+    """
+    Contains the server health and circuit breaker constants.
+    """
+    # Consecutive failures that open the circuit
+    FAILURE_THRESHOLD = 5
+    # Seconds the circuit stays open before a request probes the server
+    RESET_TIMEOUT = 30
+    # Number of requests used to compute the error rate
+    WINDOW = 20
+    # Weight of the last request in the latency EWMA
+    LATENCY_ALPHA = 0.2
 
 
 class Vault:
@@ -31,3 +84,5 @@ class Vault:
     """
     ACCESS_TOKEN_KEY = "access_token"
     REFRESH_TOKEN_KEY = "refresh_token"
+    # Seconds the changes of the tokens wait before being saved
+    WRITE_DELAY = 2
@@ -3,12 +3,20 @@
 Package containing the Giscube API client.
 """
 
+import threading
+import time
+
 import requests
-import keyring
+from requests.exceptions import Timeout
 
-from .constants import OAuth, Api, Vault
+from .compression import TransferStats
+from .constants import OAuth, Api, Http, Vault
 from .exceptions import Unauthorized
-from .utils import urljoin
+from .health import ServerHealth
+from .token_store import default_store
+from .timeouts import DeadlineExceeded, TimeoutAdapter, check_deadline, \
+    remaining
+from .utils import is_transient, urljoin
 from .category import CategoryApi
 from .qgis_server import QgisServer
 
@@ -16,7 +24,16 @@ from .qgis_server import QgisServer
 class Giscube:
     """
     Giscube API client.
-    Handles the login and receives token. It can be saved in a vault.
+    Handles the login and receives token. It can be saved in a vault
+    (through a token_store.TokenStore).
+    The access token is refreshed before it expires (or after the server
+    rejects it), only once at a time: concurrent requests wait for the
+    refresh in progress instead of refreshing it again.
+    Keeps the health of the server (see health): the requests fail at once
+    with health.CircuitOpen while the server is failing.
+    The project uploads can be compressed, if the server accepts it (see
+    compress_uploads), and the bytes they save are counted in
+    transfer_stats.
     """
     KEYRING_PREFIX = "giscube-admin-qgis-plugin-"
 
@@ -25,32 +42,74 @@ class Giscube:
             server_url,
             client_id,
             save_tokens=True,
-            name=''):
-        """
-        Contructor. Sets up the initial state. Loads, if enabled, the tokens
-        saved in the vault.
+            name='',
+            pool_connections=Http.POOL_CONNECTIONS,
+            pool_maxsize=Http.POOL_MAXSIZE,
+            pool_block=Http.POOL_BLOCK,
+            token_store=None,
+            load_tokens=True,
+            compress_uploads=False):
+        """
+        Contructor. Sets up the initial state. Loads the tokens saved in the
+        vault, now or when they are first needed.
         :param server_url: Base URL of the server to connect to.
         :type server_url: str
         :param client_id: Application OAuth client ID.
         :type client_id: str or unicode
         :param save_tokens: Should the tokens be saved in the vault?
         :type save_tokens: bool
+        :param pool_connections: Number of per-host connection pools kept.
+        :type pool_connections: int
+        :param pool_maxsize: Maximum number of keep-alive connections kept
+        open to a single host.
+        :type pool_maxsize: int
+        :param pool_block: Should a request wait for a free connection when
+        pool_maxsize connections to the host are already in use?
+        :type pool_block: bool
+        :param token_store: Cache of the vault where the tokens are saved.
+        token_store.default_store if None.
+        :type token_store: backend.token_store.TokenStore
+        :param load_tokens: Load the saved tokens now? Otherwise they are
+        loaded by load_tokens or when they are first needed.
+        :type load_tokens: bool
+        :param compress_uploads: Compress the uploaded projects (gzip)? Only
+        for the servers that decode compressed requests.
+        :type compress_uploads: bool
         """
 
         self._server_url = server_url
         self._client_id = client_id
         self.__access_token = None
         self.__refresh_token = None
+        self.__expires_at = None
+        self.__refresh_lock = threading.Lock()
+        self.__tokens_loaded = False
+        self.__tokens_lock = threading.Lock()
 
         self.__qgis_server = None
 
         self._save = save_tokens
         self.__name = name
         self._keyring_client_name = self.KEYRING_PREFIX + name
+        self.__store = token_store if token_store is not None else \
+            default_store
+
+        self.__session = self.__make_session(
+            pool_connections,
+            pool_maxsize,
+            pool_block,
+        )
+
+        self.__health = ServerHealth()
+        self.__transfer_stats = TransferStats()
+        # Cleared when the server rejects a compressed request that it
+        #  accepts uncompressed
+        self.compress_uploads = compress_uploads
 
         self.__category_api = CategoryApi(self)
 
-        self.__load_tokens()
+        if load_tokens:
+            self.load_tokens()
 
     @property
     def name(self):
@@ -61,8 +120,10 @@ class Giscube:
 
     @name.setter
     def name(self, name):
+        self.load_tokens()
         self.delete_saved()
         self.__name = name
+        self._keyring_client_name = self.KEYRING_PREFIX + name
         self.__save_tokens()
 
     @property
@@ -82,6 +143,29 @@ class Giscube:
 
         return self.__qgis_server
 
+    @property
+    def session(self):
+        """
+        Pooled HTTP session (keep-alive) used for all the requests to this
+        server.
+        """
+        return self.__session
+
+    @property
+    def health(self):
+        """
+        Health of the server and circuit breaker of its requests.
+        """
+        return self.__health
+
+    @property
+    def transfer_stats(self):
+        """
+        Bytes of the projects transferred to and from the server and saved
+        by the compression.
+        """
+        return self.__transfer_stats
+
     @property
     def server_url(self):
         """
@@ -101,6 +185,7 @@ class Giscube:
         """
         Does it have an access token?
         """
+        self.load_tokens()
         return self.__access_token is not None
 
     @property
@@ -108,13 +193,25 @@ class Giscube:
         """
         Current access token.
         """
+        self.load_tokens()
         return self.__access_token
 
+    @property
+    def expires_in(self):
+        """
+        Seconds until the access token expires (it may be negative), or None
+        if it is unknown.
+        """
+        if self.__expires_at is None:
+            return None
+        return self.__expires_at - time.monotonic()
+
     @property
     def has_refresh_token(self):
         """
         Does it have a refresh token?
         """
+        self.load_tokens()
         return self.__refresh_token is not None
 
     @property
@@ -124,6 +221,13 @@ class Giscube:
         """
         return self.has_access_token
 
+    @property
+    def tokens_loaded(self):
+        """
+        Have the saved tokens been loaded (or replaced)?
+        """
+        return self.__tokens_loaded
+
     @property
     def save_tokens(self):
         """
@@ -133,6 +237,7 @@ class Giscube:
 
     @save_tokens.setter
     def save_tokens(self, v):
+        self.load_tokens()
         self.delete_saved()
         self._save = (v is True)
         self.__save_tokens()
@@ -153,7 +258,7 @@ class Giscube:
         ):
             return False
 
-        response = requests.post(
+        response = self.__request(lambda: self.__session.post(
             urljoin(self._server_url, OAuth.PATH),
             data={
                 'username': user,
@@ -161,84 +266,104 @@ class Giscube:
                 'grant_type': 'password',
                 'client_id': self._client_id,
             }
-        )
+        ))
 
         if response.status_code == OAuth.UNAUTHORIZED:
             return False
         response.raise_for_status()
         response_object = response.json()
 
-        if 'access_token' in response_object:
-            self.__access_token = response_object['access_token']
-        else:
+        if 'access_token' not in response_object:
             return False
 
         self.__refresh_token = None
-        if 'refresh-token' in response_object:
-            self.__refresh_token = response_object['refresh-token']
-
-        self.__save_tokens()
+        self.__set_tokens(response_object)
 
         return True
 
-    def refresh_token(self):
+    def refresh_token(self, stale_token=None):
         """
         Refreshes the token with the refresh token. Returns if it succeded.
+        Only one refresh is made at a time: the others wait for it.
+        :param stale_token: The access token that has to be replaced. If it
+        has already been replaced (ie. by a concurrent refresh), it is not
+        refreshed again. None always refreshes it.
+        :type stale_token: str or None
+        :raises requests.exceptions.HTTPError: when the server responses with
+        an unexpected error status code
         """
-        if not self.has_refresh_token:
-            return False
+        with self.__refresh_lock:
+            if (
+                stale_token is not None
+                and self.__access_token != stale_token
+                and self.has_access_token
+            ):
+                return True
 
-        response = requests.post(
-            urljoin(self._server_url, OAuth.PATH),
-            data={
-                'refresh-token': self.refresh_token,
-                'grant_type': 'refresh_token',
-                'client_id': self._client_id,
-            }
-        )
+            if not self.has_refresh_token:
+                return False
 
-        if response.status_code == OAuth.UNAUTHORIZED:
-            return False
+            refresh_token = self.__refresh_token
+            response = self.__request(lambda: self.__session.post(
+                urljoin(self._server_url, OAuth.PATH),
+                data={
+                    'refresh_token': refresh_token,
+                    'grant_type': 'refresh_token',
+                    'client_id': self._client_id,
+                }
+            ))
 
-        response.raise_for_status()
-        response_object = response.json()
+            if response.status_code == OAuth.UNAUTHORIZED:
+                return False
 
-        token = response_object['access_token']
-        refresh_token = response_object['refresh_token']
+            response.raise_for_status()
+            self.__set_tokens(response.json())
 
-        self.__token = token
-        self.__refresh_token = refresh_token
-        self.__saveTokens()
+            return True
 
-        return True
+    def load_tokens(self):
+        """
+        Loads the tokens saved in the vault, unless they have already been
+        loaded or replaced. The vault may be slow, so it can be called in the
+        background. Concurrent calls wait for the first one.
+        """
+        if self.__tokens_loaded:
+            return
+        with self.__tokens_lock:
+            if not self.__tokens_loaded:
+                self.__load_tokens()
+                self.__tokens_loaded = True
 
     def remove_tokens(self):
         """
         Remove the tokens from memory and storage.
         """
-        self.__access_token = None
-        self.__refresh_token = None
+        with self.__tokens_lock:
+            self.__tokens_loaded = True
+            self.__access_token = None
+            self.__refresh_token = None
+            self.__expires_at = None
         self.delete_saved()
 
     def delete_saved(self):
         """
         Deletes the locally saved tokens (if they are).
         """
-        try:
-            keyring.delete_password(
-                self._keyring_client_name,
-                Vault.ACCESS_TOKEN_KEY,
-            )
-        except:
-            pass
+        self.__store.delete(
+            self._keyring_client_name,
+            Vault.ACCESS_TOKEN_KEY,
+        )
+        self.__store.delete(
+            self._keyring_client_name,
+            Vault.REFRESH_TOKEN_KEY,
+        )
 
-        try:
-            keyring.delete_password(
-                self._keyring_client_name,
-                Vault.REFRESH_TOKEN_KEY,
-            )
-        except:
-            pass
+    def close(self):
+        """
+        Closes the pooled connections to the server. The session can still be
+        used afterwards, it reconnects on demand.
+        """
+        self.__session.close()
 
     @property
     def category_api(self):
@@ -250,6 +375,9 @@ class Giscube:
 
         It makes the request (which must be a function that returns the
         result). If it fails, it tries to refresh the token and tries again.
+        The requests are limited by the deadline of the thread (see
+        backend.timeouts.deadline). If the access token is about to expire,
+        it is refreshed first.
 
         Returns the parsed json object.
 
@@ -259,18 +387,32 @@ class Giscube:
         server didn't accept the credentials.
         :raises requests.exceptions.HTTPError: When the server responses with
         an unexpected error status code
+        :raises backend.timeouts.DeadlineExceeded: When the deadline expired
+        before the response was received.
         """
-        response = make_request(*args)
+        self.load_tokens()
+        self.__refresh_if_expiring()
+
+        access_token = self.__access_token
+        response = self.__request(make_request, *args)
         if response.status_code == Api.UNAUTHORIZED:
+            # Release the connection of a streamed response
+            response.close()
             if not self.has_refresh_token:
                 raise Unauthorized()
 
-            self.refresh_token()
+            if not self.refresh_token(access_token):
+                raise Unauthorized()
 
-            response = make_request(*args)
+            response = self.__request(make_request, *args)
             if response.status_code == Api.UNAUTHORIZED:
+                response.close()
                 raise Unauthorized()
 
+        if response.status_code >= 400:
+            # The caller never gets a failed response: release its connection
+            #  (it is still open if it was streamed)
+            response.close()
         response.raise_for_status()
 
         if process_result:
@@ -278,6 +420,89 @@ class Giscube:
         else:
             return response
 
+    def __refresh_if_expiring(self):
+        """
+        Refreshes the access token if it expires in less than
+        OAuth.REFRESH_MARGIN seconds.
+        """
+        expires_in = self.expires_in
+        if (
+            expires_in is not None
+            and expires_in < OAuth.REFRESH_MARGIN
+            and self.has_refresh_token
+        ):
+            self.refresh_token(self.__access_token)
+
+    def __set_tokens(self, response_object):
+        """
+        Keeps (and saves) the tokens of a response of the token endpoint. The
+        refresh token is kept if it doesn't send a new one.
+        """
+        with self.__tokens_lock:
+            self.__tokens_loaded = True
+            if 'expires_in' in response_object:
+                self.__expires_at = (
+                    time.monotonic() + float(response_object['expires_in'])
+                )
+            else:
+                self.__expires_at = None
+            if 'refresh_token' in response_object:
+                self.__refresh_token = response_object['refresh_token']
+            self.__access_token = response_object['access_token']
+
+        self.__save_tokens()
+
+    def __request(self, make_request, *args):
+        """
+        Makes a request unless the deadline expired or the circuit is open.
+        Timeouts caused by the deadline raise DeadlineExceeded. Records the
+        result in the health of the server, unless the request failed
+        because of a local error (see utils.is_transient).
+        """
+        check_deadline()
+        self.__health.before_request()
+        start = time.monotonic()
+        try:
+            response = make_request(*args)
+        except DeadlineExceeded:
+            self.__health.failure()
+            raise
+        except Timeout as e:
+            self.__health.failure()
+            left = remaining()
+            if left is not None and left <= 0:
+                raise DeadlineExceeded() from e
+            raise
+        except Exception as e:
+            if is_transient(e):
+                self.__health.failure()
+            else:
+                self.__health.aborted()
+            raise
+
+        status = response.status_code
+        if status == Api.TOO_MANY_REQUESTS or status in Api.SERVER_ERRORS:
+            self.__health.failure()
+        else:
+            self.__health.success(time.monotonic() - start)
+        return response
+
+    @staticmethod
+    def __make_session(pool_connections, pool_maxsize, pool_block):
+        """
+        Makes a requests session that keeps the connections alive and reuses
+        them between requests. Its requests always have a timeout.
+        """
+        session = requests.Session()
+        adapter = TimeoutAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
     def __load_tokens(self):
         """
         Loads the tokens from a safe place.
@@ -285,33 +510,30 @@ class Giscube:
         if self.__access_token is not None and not self._save:
             return
 
-        self.__access_token = keyring.get_password(
+        self.__access_token = self.__store.get(
             self._keyring_client_name,
             Vault.ACCESS_TOKEN_KEY,
         )
-        self.__refresh_token = keyring.get_password(
+        self.__refresh_token = self.__store.get(
             self._keyring_client_name,
             Vault.REFRESH_TOKEN_KEY,
         )
 
     def __save_tokens(self):
         """
-        Saves the tokens in a safe place (locally).
+        Saves the tokens in a safe place (locally). Unchanged tokens are not
+        saved again and the missing ones are deleted.
         """
         if not self._save:
             return
 
-        self.delete_saved()
-
-        if self.has_access_token:
-            keyring.set_password(
-                self._keyring_client_name,
-                Vault.ACCESS_TOKEN_KEY,
-                self.__access_token,
-            )
-        if self.has_refresh_token:
-            keyring.set_password(
-                self._keyring_client_name,
-                Vault.REFRESH_TOKEN_KEY,
-                self.__refresh_token,
-            )
+        self.__store.set(
+            self._keyring_client_name,
+            Vault.ACCESS_TOKEN_KEY,
+            self.__access_token,
+        )
+        self.__store.set(
+            self._keyring_client_name,
+            Vault.REFRESH_TOKEN_KEY,
+            self.__refresh_token,
+        )
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+"""
+Health of the connection to a Giscube server and its circuit breaker.
+"""
+
+import threading
+import time
+from collections import deque
+
+from requests.exceptions import RequestException
+
+from .constants import Health
+
+
+class CircuitOpen(RequestException):
+    """
+    The request was not made because the server has been failing. It will be
+    tried again after the reset timeout.
+    """
+    def __init__(self, retry_in):
+        """
+        Constructor.
+        :param retry_in: Seconds until a request is tried again.
+        :type retry_in: float
+        """
+        super().__init__(
+            'The server is failing, retrying in {:.0f} s'.format(retry_in)
+        )
+        self.retry_in = retry_in
+
+
+class ServerHealth:
+    """
+    Keeps the error rate and the latency (EWMA) of the last requests to a
+    server, and a circuit breaker: after failure_threshold consecutive
+    failures the circuit is opened and the requests fail at once with
+    CircuitOpen. After reset_timeout seconds a single request (half-open) is
+    let through to probe the server: if it succeeds the circuit is closed,
+    otherwise it is opened again.
+    It is thread safe.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(
+            self,
+            failure_threshold=Health.FAILURE_THRESHOLD,
+            reset_timeout=Health.RESET_TIMEOUT,
+            window=Health.WINDOW,
+            latency_alpha=Health.LATENCY_ALPHA):
+        """
+        Constructor.
+        :param failure_threshold: Consecutive failures that open the circuit.
+        :type failure_threshold: int
+        :param reset_timeout: Seconds the circuit stays open before probing.
+        :type reset_timeout: float
+        :param window: Number of requests used to compute the error rate.
+        :type window: int
+        :param latency_alpha: Weight of the last latency in its EWMA.
+        :type latency_alpha: float
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.latency_alpha = latency_alpha
+        self.listener = None
+
+        self.__results = deque(maxlen=window)
+        self.__latency = None
+        self.__consecutive_failures = 0
+        self.__state = self.CLOSED
+        self.__opened_at = None
+        self.__probing = False
+        self.__lock = threading.Lock()
+
+    @property
+    def state(self):
+        """
+        State of the circuit: CLOSED, OPEN or HALF_OPEN.
+        """
+        with self.__lock:
+            return self.__state
+
+    @property
+    def error_rate(self):
+        """
+        Fraction of the last requests that failed, or None if none was made.
+        """
+        with self.__lock:
+            if not self.__results:
+                return None
+            return self.__results.count(False) / len(self.__results)
+
+    @property
+    def latency(self):
+        """
+        Exponentially weighted moving average of the latency of the
+        successful requests, in seconds. None if none succeeded.
+        """
+        with self.__lock:
+            return self.__latency
+
+    def before_request(self):
+        """
+        Called before making a request.
+        :raises CircuitOpen: if the circuit is open, or half-open and the
+        probe is already being made.
+        """
+        with self.__lock:
+            if self.__state == self.CLOSED:
+                return
+
+            now = time.monotonic()
+            retry_in = self.__opened_at + self.reset_timeout - now
+            if self.__state == self.OPEN and retry_in <= 0:
+                changed = self.__set_state(self.HALF_OPEN)
+            elif self.__state == self.HALF_OPEN and not self.__probing:
+                changed = False
+            else:
+                raise CircuitOpen(max(retry_in, 0))
+            self.__probing = True
+        self.__notify(changed)
+
+    def success(self, latency):
+        """
+        A request got a response from the server.
+        :param latency: Seconds it took.
+        :type latency: float
+        """
+        with self.__lock:
+            self.__results.append(True)
+            if self.__latency is None:
+                self.__latency = latency
+            else:
+                self.__latency += self.latency_alpha * (
+                    latency - self.__latency
+                )
+            self.__consecutive_failures = 0
+            self.__probing = False
+            changed = self.__set_state(self.CLOSED)
+        self.__notify(changed)
+
+    def failure(self):
+        """
+        A request failed because the server could not be reached, took too
+        long or failed (see utils.is_transient).
+        """
+        with self.__lock:
+            self.__results.append(False)
+            self.__consecutive_failures += 1
+            if (
+                self.__state == self.HALF_OPEN
+                or self.__consecutive_failures >= self.failure_threshold
+            ):
+                self.__opened_at = time.monotonic()
+                changed = self.__set_state(self.OPEN)
+            else:
+                changed = False
+            self.__probing = False
+        self.__notify(changed)
+
+    def aborted(self):
+        """
+        A request failed for a reason that says nothing about the server
+        (not transient, see utils.is_transient). Nothing is recorded: it only
+        lets the next probe through if it was the probe.
+        """
+        with self.__lock:
+            self.__probing = False
+
+    def __set_state(self, state):
+        # Call with self.__lock acquired. Returns if it changed.
+        changed = self.__state != state
+        self.__state = state
+        return changed
+
+    def __notify(self, changed):
+        # Calls the listener (from the thread of the request) with the new
+        #  state.
+        listener = self.listener
+        if changed and listener is not None:
+            listener(self.state)
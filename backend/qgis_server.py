@@ -4,19 +4,27 @@ Package containing all the classes and utilities to communicate with the
 Giscube server.
 """
 
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
 import time
-import requests
 
 from PyQt5.QtCore import QDir
 
-from .constants import Api
+from .compression import CompressedBody
+from .constants import Api, Compression, Http
 from .exceptions import Unauthorized
-from .utils import urljoin
+from .streaming import MultipartBody, extract_field
+from .utils import file_digest, urljoin
 
 
 class QgisServer:
     """
     Giscube's QGis Server API client.
+    Remembers the hash of the last contents of each project downloaded from
+    or uploaded to the server, so unchanged projects are not uploaded again.
     """
 
     WRITE_DIR = QDir.tempPath()
@@ -29,6 +37,9 @@ class QgisServer:
         :type token_handler: backend.Giscube
         """
         self.giscube = giscube
+        self.__digests = {}
+        self.__upload_locks = {}
+        self.__digests_lock = threading.Lock()
 
     def projects(self):
         """
@@ -51,13 +62,21 @@ class QgisServer:
         }
         return projects, services
 
-    def download_project(self, project_id):
+    def download_project(self, project_id, progress=None):
         """
         Downloads the project file.
         Returns the path of the file.
 
+        The response is streamed: the project is written to the file while
+        it is received, so it is never held in memory. It is received
+        compressed if the server supports it.
+
         :param project_id: Project's ID in the server.
         :type project_id: int or str
+        :param progress: Called with the bytes received (on the wire) and the
+        size of the response (None if unknown) after each chunk. The
+        download can be cancelled by raising from it.
+        :type progress: callable or None
         :raise Unauthorized: When the request is not successful because the
         server didn't accept the credentials.
         :raises requests.exceptions.HTTPError: When the server responses with
@@ -66,31 +85,86 @@ class QgisServer:
         if not self.giscube.is_logged_in:
             raise Unauthorized()
 
-        response = self.giscube.try_request(self.__request_project, project_id)
+        response = self.giscube.try_request(
+            self.__request_project,
+            project_id,
+            True,
+            process_result=False,
+        )
 
         t = '{:.0f}'.format(time.time())
         path = self.WRITE_DIR + (
             '/qgis-admin-project-'+str(project_id)+'-'+t+'.qgs'
         )
-        with open(path, 'w') as f:
-            if 'data' in response:
-                f.write(response['data'])
-
+        # Content-Length is the size of the compressed response
+        encoded = bool(response.headers.get('Content-Encoding'))
+        content = [0]
+        # The file is written as received (without translating the newlines)
+        #  so its hash is the hash of the project in the server
+        digest = hashlib.sha256()
+
+        def write(piece):
+            data = piece.encode('utf-8')
+            digest.update(data)
+            f.write(data)
+
+        def received(size, total):
+            content[0] = size
+            if progress is not None:
+                progress(response.raw.tell() if encoded else size, total)
+
+        try:
+            total = response.headers.get('Content-Length')
+            with open(path, 'wb') as f:
+                extract_field(
+                    response.iter_content(Http.CHUNK_SIZE),
+                    'data',
+                    write,
+                    received,
+                    int(total) if total else None,
+                )
+            self.giscube.transfer_stats.add_received(
+                response.raw.tell() if encoded else content[0],
+                content[0],
+            )
+        except BaseException:
+            # Don't leave a partial project behind (ie. if the progress
+            #  callback cancelled the download)
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        finally:
+            response.close()
+
+        self.__set_digest(project_id, digest.hexdigest())
         return path
 
-    def upload_project(self, project_id, title, path):
+    def upload_project(self, project_id, title, path, progress=None):
         """
         Uploads the project from a path to the server with project_name.
         Overrides it in the server if a project_id is given (there must exist a
         project with that ID).
         Returns the project ID.
 
+        A copy of the file is taken when the upload starts and streamed from
+        disk while it is sent, so it is never held in memory and later saves
+        don't change the contents being sent. It is compressed (gzip) if
+        giscube.compress_uploads: if the server rejects the compressed body
+        (see Compression.REJECTED) it is sent again uncompressed, and if that
+        is accepted the next uploads are not compressed.
+        Nothing is uploaded if the server already has the same contents (see
+        is_modified); use a None path to change only the title. The uploads
+        of the same project wait for each other.
+
         :param project_id: Project's ID in the server.
         :type project_id: int or str
         :param title: Project's tile in the server.
         :type title: str
         :param path: Project's ID in the server.
         :type path: str or unicode
+        :param progress: Called with the bytes sent and the size of the
+        request (compressed, if it is) after each chunk.
+        :type progress: callable or None
         :raise Unauthorized: When the request is not successful because the
         server didn't accept the credentials.
         :raises requests.exceptions.HTTPError: When the server responses with
@@ -99,21 +173,27 @@ class QgisServer:
         if not self.giscube.is_logged_in:
             raise Unauthorized()
 
-        if path is not None:
-            with open(path, 'r') as f:
-                qgis_project = f.read()
-        else:
-            qgis_project = None
+        if project_id is None:
+            return self.__upload(project_id, title, path, progress)
 
-        result = self.giscube.try_request(
-            self.__push_project,
-            project_id,
-            title,
-            qgis_project,
-            process_result=False,
-        )
+        # The uploads of a project are made one at a time, so the file is
+        #  copied (and hashed) after the previous upload finished and the
+        #  last one sends its last contents
+        with self.__upload_lock(project_id):
+            return self.__upload(project_id, title, path, progress)
 
-        return result.json()['id']
+    def is_modified(self, project_id, path):
+        """
+        Is the file different from the last contents of the project
+        downloaded from or uploaded to the server? True if they are unknown.
+
+        :param project_id: Project's ID in the server.
+        :type project_id: int or str
+        :param path: Path of the project file.
+        :type path: str
+        """
+        digest = self.__get_digest(project_id)
+        return digest is None or digest != file_digest(path)
 
     def delete_project(self, project_id):
         """
@@ -131,6 +211,7 @@ class QgisServer:
             project_id,
             process_result=False,
         )
+        self.__set_digest(project_id, None)
 
     def publish_project(self, project_id,
                         title, description, keywords, on_geoportal,
@@ -168,8 +249,67 @@ class QgisServer:
         )
         return result["service"]
 
+    def __upload(self, project_id, title, path, progress):
+        if path is None:
+            return self.__upload_snapshot(project_id, title, None, progress)
+
+        # QGis may save the project again while it is sent: a copy of the
+        #  file is hashed and sent (again, if the request is retried), so the
+        #  digest remembered is the one of the contents in the server
+        fd, snapshot = tempfile.mkstemp(
+            os.path.splitext(path)[1],
+            dir=self.WRITE_DIR,
+        )
+        try:
+            with os.fdopen(fd, 'wb') as f, open(path, 'rb') as source:
+                shutil.copyfileobj(source, f)
+            return self.__upload_snapshot(project_id, title, snapshot,
+                                          progress)
+        finally:
+            os.remove(snapshot)
+
+    def __upload_snapshot(self, project_id, title, path, progress):
+        digest = None
+        if path is not None:
+            digest = file_digest(path)
+            if project_id is not None and \
+                    self.__get_digest(project_id) == digest:
+                return project_id
+
+        result = self.giscube.try_request(
+            self.__push_project,
+            project_id,
+            title,
+            path,
+            progress,
+            process_result=False,
+        )
+
+        project_id = result.json()['id']
+        if digest is not None:
+            self.__set_digest(project_id, digest)
+        return project_id
+
+    def __upload_lock(self, project_id):
+        with self.__digests_lock:
+            return self.__upload_locks.setdefault(
+                str(project_id),
+                threading.Lock(),
+            )
+
+    def __get_digest(self, project_id):
+        with self.__digests_lock:
+            return self.__digests.get(str(project_id))
+
+    def __set_digest(self, project_id, digest):
+        with self.__digests_lock:
+            if digest is None:
+                self.__digests.pop(str(project_id), None)
+            else:
+                self.__digests[str(project_id)] = digest
+
     def __request_projects_list(self):
-        return requests.get(
+        return self.giscube.session.get(
             urljoin(
                 self.giscube.server_url,
                 Api.PATH,
@@ -180,8 +320,8 @@ class QgisServer:
             }
         )
 
-    def __request_project(self, project_id):
-        return requests.get(
+    def __request_project(self, project_id, stream=False):
+        return self.giscube.session.get(
             urljoin(
                 self.giscube.server_url,
                 Api.PATH,
@@ -190,43 +330,81 @@ class QgisServer:
             params={
                 'client_id': self.giscube.client_id,
                 'access_token': self.giscube.access_token,
-            }
+            },
+            headers={'Accept-Encoding': 'gzip, deflate'},
+            stream=stream,
         )
 
-    def __push_project(self, project_id, title, qgis_project):
+    def __push_project(self, project_id, title, path, progress):
         if project_id is None:  # if need to create a new project
-            request = requests.post
+            request = self.giscube.session.post
             url = urljoin(
                 self.giscube.server_url,
                 Api.PATH,
                 Api.PROJECTS,
             )
-            payload = {
-                'client_id': self.giscube.client_id,
-                'access_token': self.giscube.access_token,
-                'name': title,
-                'data': qgis_project,
-            }
         else:
-            request = requests.put
+            request = self.giscube.session.put
             url = urljoin(
                 self.giscube.server_url,
                 Api.PATH,
                 Api.PROJECTS,
                 str(project_id),
             )
-            payload = {
-                'client_id': self.giscube.client_id,
-                'access_token': self.giscube.access_token,
-                'name': title,
-            }
-            if qgis_project is not None:
-                payload['data'] = qgis_project
-
-        return request(
-            url,
-            data=payload
-        )
+        # The credentials are not in the body, so a server that can't read
+        #  a compressed body still knows who sends it
+        params = {
+            'client_id': self.giscube.client_id,
+            'access_token': self.giscube.access_token,
+        }
+        fields = [('name', title)]
+
+        if path is None:
+            return request(url, params=params, data=dict(fields))
+
+        if not self.giscube.compress_uploads:
+            return self.__send_project(
+                request, url, params, fields, path, progress, False)
+
+        response = self.__send_project(
+            request, url, params, fields, path, progress, True)
+        if response.status_code not in Compression.REJECTED:
+            return response
+
+        # The server may not understand the compressed body: it is sent
+        #  again uncompressed, and if it is accepted the next uploads are not
+        #  compressed
+        response.close()
+        response = self.__send_project(
+            request, url, params, fields, path, progress, False)
+        if response.status_code < 400:
+            self.giscube.compress_uploads = False
+        return response
+
+    def __send_project(self, request, url, params, fields, path, progress,
+                       compress):
+        # The body is made for each attempt: a retried request sends the
+        #  file again from the start
+        with open(path, 'rb') as f:
+            body = MultipartBody(fields + [('data', f)])
+            headers = {'Content-Type': body.content_type}
+            content_length = len(body)
+            compressed = compress and content_length >= Compression.MIN_SIZE
+            if compressed:
+                body = CompressedBody(body)
+                headers['Content-Encoding'] = CompressedBody.ENCODING
+            body.progress = progress
+
+            try:
+                response = request(url, params=params, data=body,
+                                   headers=headers)
+            finally:
+                if compressed:
+                    body.close()
+
+        if response.status_code < 400:
+            self.giscube.transfer_stats.add_sent(len(body), content_length)
+        return response
 
     def __delete_project(self, project_id):
         url = urljoin(
@@ -236,7 +414,7 @@ class QgisServer:
             str(project_id),
         )
 
-        return requests.delete(
+        return self.giscube.session.delete(
             url,
             data={
                 'client_id': self.giscube.client_id,
@@ -254,7 +432,7 @@ class QgisServer:
             str(project_id),
             Api.PUBLISH,
         )
-        return requests.post(
+        return self.giscube.session.post(
             url,
             data={
                 'client_id': self.giscube.client_id,
@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+"""
+Streaming of big request and response bodies: incremental extraction of a
+field of a JSON response, so big values can be written to disk while they are
+received, and multipart bodies read from disk while they are sent, instead of
+being held in memory.
+"""
+
+import codecs
+import os
+import uuid
+
+from .constants import Http
+
+_ESCAPES = {
+    '"': '"',
+    '\\': '\\',
+    '/': '/',
+    'b': '\b',
+    'f': '\f',
+    'n': '\n',
+    'r': '\r',
+    't': '\t',
+}
+
+
+class JsonFieldExtractor:
+    """
+    Extracts the string value of a field of the top level object of a JSON
+    document fed in chunks. The pieces of the value are returned by feed as
+    soon as they are decoded; the rest of the document is skipped.
+    Only the string values of the field are extracted (null is ignored).
+    """
+    def __init__(self, field):
+        """
+        Constructor.
+        :param field: Name of the field.
+        :type field: str
+        """
+        self.field = field
+        self.found = False
+
+        self.__decoder = codecs.getincrementaldecoder('utf-8')()
+        self.__depth = 0
+        self.__expect_key = False
+        self.__key = None
+        self.__last_key = None
+        # None, 'key', 'skip' or 'value'
+        self.__string = None
+        self.__escape = None
+        self.__high_surrogate = None
+
+    def feed(self, chunk):
+        """
+        Parses a chunk of the document. Returns the decoded part of the value
+        of the field in this chunk ('' if none).
+        :param chunk: Next bytes of the document.
+        :type chunk: bytes
+        """
+        text = self.__decoder.decode(chunk)
+        out = []
+        i = 0
+        n = len(text)
+        while i < n:
+            if self.__string == 'value' and self.__escape is None:
+                i = self.__copy_value(text, i, out)
+                continue
+
+            c = text[i]
+            i += 1
+            if self.__string is not None:
+                self.__string_char(c, out)
+            elif c == '"':
+                if self.__depth == 1 and self.__expect_key:
+                    self.__string = 'key'
+                    self.__key = []
+                elif self.__depth == 1 and self.__last_key == self.field:
+                    self.__string = 'value'
+                    self.found = True
+                else:
+                    self.__string = 'skip'
+            elif c in '{[':
+                self.__depth += 1
+                self.__expect_key = (c == '{')
+            elif c in '}]':
+                self.__depth -= 1
+            elif c == ',':
+                self.__expect_key = (self.__depth == 1)
+                self.__last_key = None
+            elif c == ':':
+                self.__expect_key = False
+
+        return ''.join(out)
+
+    def __copy_value(self, text, i, out):
+        # Copies the characters of the value until the next quote or escape
+        quote = text.find('"', i)
+        backslash = text.find('\\', i)
+        if quote == -1:
+            quote = len(text)
+        if backslash == -1:
+            backslash = len(text)
+        end = min(quote, backslash)
+
+        if end > i:
+            self.__flush_surrogate(out)
+            out.append(text[i:end])
+        if end == len(text):
+            return end
+
+        if end == quote:
+            self.__flush_surrogate(out)
+            self.__string = None
+            self.__last_key = None
+        else:
+            self.__escape = ''
+        return end + 1
+
+    def __string_char(self, c, out):
+        # A character inside a string (or of one of its escapes)
+        if self.__escape is not None:
+            self.__escape += c
+            if self.__escape[0] == 'u':
+                if len(self.__escape) < 5:
+                    return
+                char = chr(int(self.__escape[1:], 16))
+            else:
+                char = _ESCAPES.get(c, c)
+            self.__escape = None
+            self.__append(char, out)
+        elif c == '\\':
+            self.__escape = ''
+        elif c == '"':
+            if self.__string == 'key':
+                self.__last_key = ''.join(self.__key)
+                self.__key = None
+            self.__string = None
+        else:
+            self.__append(c, out)
+
+    def __append(self, char, out):
+        # Appends a decoded character to the current string
+        if self.__string == 'key':
+            self.__key.append(char)
+        elif self.__string == 'value':
+            if '\ud800' <= char <= '\udbff':
+                self.__flush_surrogate(out)
+                self.__high_surrogate = char
+                return
+            if '\udc00' <= char <= '\udfff' and \
+                    self.__high_surrogate is not None:
+                pair = self.__high_surrogate + char
+                self.__high_surrogate = None
+                out.append(
+                    pair.encode('utf-16', 'surrogatepass').decode('utf-16')
+                )
+                return
+            self.__flush_surrogate(out)
+            out.append(char)
+
+    def __flush_surrogate(self, out):
+        # A lone high surrogate is kept as is (like json.loads does)
+        if self.__high_surrogate is not None:
+            out.append(self.__high_surrogate)
+            self.__high_surrogate = None
+
+
+def extract_field(chunks, field, write, progress=None, total=None):
+    """
+    Writes the string value of a field of a JSON document received in
+    chunks, piece by piece. Returns if the field was found.
+    :param chunks: The bytes of the document.
+    :type chunks: iterable of bytes
+    :param field: Name of the field of the top level object.
+    :type field: str
+    :param write: Called with each decoded piece of the value.
+    :type write: callable
+    :param progress: Called with the bytes received so far and total after
+    each chunk.
+    :type progress: callable or None
+    :param total: Size of the document, if known.
+    :type total: int or None
+    """
+    extractor = JsonFieldExtractor(field)
+    received = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        piece = extractor.feed(chunk)
+        if piece:
+            write(piece)
+        received += len(chunk)
+        if progress is not None:
+            progress(received, total)
+    return extractor.found
+
+
+class MultipartBody:
+    """
+    A multipart/form-data request body whose fields may be files, which are
+    read from disk while the body is sent. It is a file-like object with a
+    known length, so requests sends it with a Content-Length in chunks.
+    The files are sent as plain form fields (without filename), like the
+    string fields.
+    """
+    def __init__(self, fields, progress=None):
+        """
+        Constructor.
+        :param fields: Name and value of the fields. The values are str or
+        binary files opened for reading, which are read from their current
+        position until the end. The fields that are None are not sent.
+        :type fields: list of tuple
+        :param progress: Called with the bytes sent so far and the length of
+        the body each time a chunk is read.
+        :type progress: callable or None
+        """
+        self.boundary = uuid.uuid4().hex
+        self.progress = progress
+        self.sent = 0
+
+        self.__parts = []
+        for name, value in fields:
+            if value is None:
+                continue
+            self.__parts.append(self.__header(name))
+            if isinstance(value, str):
+                self.__parts.append(value.encode('utf-8'))
+            else:
+                self.__parts.append(value)
+            self.__parts.append(b'\r\n')
+        self.__parts.append('--{}--\r\n'.format(self.boundary).encode())
+
+        self.__length = sum(self.__part_length(part) for part in self.__parts)
+        self.__current = 0
+        self.__offset = 0
+
+    @property
+    def content_type(self):
+        """
+        Value of the Content-Type header of the body.
+        """
+        return 'multipart/form-data; boundary={}'.format(self.boundary)
+
+    def __len__(self):
+        return self.__length
+
+    def __iter__(self):
+        # requests only streams the bodies that are iterable
+        while True:
+            chunk = self.read(Http.CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self, size=-1):
+        """
+        Reads the next size bytes of the body (all the rest if negative).
+        Returns b'' at the end.
+        :param size: Maximum number of bytes.
+        :type size: int
+        """
+        chunks = []
+        while self.__current < len(self.__parts) and size != 0:
+            part = self.__parts[self.__current]
+            if isinstance(part, bytes):
+                end = len(part) if size < 0 else self.__offset + size
+                chunk = part[self.__offset:end]
+                self.__offset += len(chunk)
+                if self.__offset >= len(part):
+                    self.__current += 1
+                    self.__offset = 0
+            else:
+                chunk = part.read(size)
+                if len(chunk) < size or size < 0:
+                    self.__current += 1
+            chunks.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+
+        data = b''.join(chunks)
+        self.sent += len(data)
+        if data and self.progress is not None:
+            self.progress(self.sent, self.__length)
+        return data
+
+    def __header(self, name):
+        return (
+            '--{}\r\n'
+            'Content-Disposition: form-data; name="{}"\r\n\r\n'
+        ).format(self.boundary, name).encode('utf-8')
+
+    @staticmethod
+    def __part_length(part):
+        if isinstance(part, bytes):
+            return len(part)
+        return os.fstat(part.fileno()).st_size - part.tell()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Deadlines of the requests made by a thread. Every request made through a
+Giscube session gets connect and read timeouts, which are shortened to fit in
+the deadline of the thread (ie. the deadline of the job being worked on).
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from requests.adapters import HTTPAdapter
+from requests.exceptions import Timeout
+
+from .constants import Http
+
+_local = threading.local()
+
+
+class DeadlineExceeded(Timeout):
+    """
+    The deadline expired before the request could be done or finished.
+    """
+    pass
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Limits the time the requests made inside the block may take. Nested
+    deadlines can only shorten it.
+    :param seconds: Seconds from now. None doesn't add any limit.
+    :type seconds: float or None
+    """
+    previous = getattr(_local, 'deadline', None)
+    if seconds is not None:
+        due = time.monotonic() + seconds
+        if previous is None or due < previous:
+            _local.deadline = due
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def remaining():
+    """
+    Returns the seconds left until the deadline of the current thread (it may
+    be negative), or None if it has no deadline.
+    """
+    due = getattr(_local, 'deadline', None)
+    if due is None:
+        return None
+    return due - time.monotonic()
+
+
+def check_deadline():
+    """
+    :raises DeadlineExceeded: if the deadline of the current thread expired.
+    """
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded()
+
+
+def request_timeout(timeout=None):
+    """
+    Returns the (connect, read) timeout of a request: the given one, or the
+    default one, shortened to the time left until the deadline.
+    :param timeout: Timeout given to the request.
+    :type timeout: float, tuple or None
+    :raises DeadlineExceeded: if the deadline of the current thread expired.
+    """
+    if timeout is None:
+        connect, read = Http.CONNECT_TIMEOUT, Http.READ_TIMEOUT
+    elif isinstance(timeout, tuple):
+        connect, read = timeout
+    else:
+        connect = read = timeout
+
+    left = remaining()
+    if left is not None:
+        if left <= 0:
+            raise DeadlineExceeded()
+        connect = left if connect is None else min(connect, left)
+        read = left if read is None else min(read, left)
+
+    return connect, read
+
+
+class TimeoutAdapter(HTTPAdapter):
+    """
+    HTTP adapter that never sends a request without a timeout (see
+    request_timeout).
+    """
+    def send(self, request, timeout=None, **kwargs):
+        return super().send(
+            request,
+            timeout=request_timeout(timeout),
+            **kwargs
+        )
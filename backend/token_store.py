@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+In-memory cache of the tokens saved in the vault (keyring).
+"""
+
+import sys
+import threading
+
+from . import vault
+from .constants import Vault
+
+
+class TokenStore:
+    """
+    Write-behind cache in front of the keyring (see vault). Reads are served
+    from memory (the keyring is read once per entry). Writes update the
+    memory and are saved later, all together, by flush: several writes of
+    the same entry are saved once and writes that don't change the value are
+    skipped.
+    The keyring may be slow (ie. D-Bus calls to the Secret Service), so
+    flush should be run in the background: scheduler is called with the
+    delay and flush when there are changes to save. Without scheduler they
+    are saved at once.
+    It is thread safe.
+    """
+    def __init__(self, delay=Vault.WRITE_DELAY, scheduler=None):
+        """
+        Constructor.
+        :param delay: Seconds the changes wait before being saved.
+        :type delay: float
+        :param scheduler: Function that calls a function after a delay
+        (seconds), ie. in a background thread.
+        :type scheduler: callable or None
+        """
+        self.delay = delay
+        self.scheduler = scheduler
+        self.reads = 0
+        self.writes = 0
+
+        # (service, key) -> value (None if it isn't saved)
+        self.__values = {}
+        # (service, key) -> value to be saved
+        self.__dirty = {}
+        self.__flush_scheduled = False
+        self.__lock = threading.RLock()
+        self.__flush_lock = threading.Lock()
+
+    def get(self, service, key):
+        """
+        Returns a saved value or None.
+        :param service: Name of the service in the keyring.
+        :type service: str
+        :param key: Name of the value.
+        :type key: str
+        """
+        entry = (service, key)
+        with self.__lock:
+            if entry in self.__values:
+                return self.__values[entry]
+
+        value = vault.get_keyring().get_password(service, key)
+
+        with self.__lock:
+            self.reads += 1
+            # A value set while it was being read wins
+            return self.__values.setdefault(entry, value)
+
+    def set(self, service, key, value):
+        """
+        Saves a value (later).
+        :param service: Name of the service in the keyring.
+        :type service: str
+        :param key: Name of the value.
+        :type key: str
+        :param value: The value. None deletes it.
+        :type value: str or None
+        """
+        entry = (service, key)
+        with self.__lock:
+            if entry in self.__values and self.__values[entry] == value:
+                return
+            self.__values[entry] = value
+            self.__dirty[entry] = value
+
+            scheduler = self.scheduler
+            schedule = scheduler is not None and not self.__flush_scheduled
+            if schedule:
+                self.__flush_scheduled = True
+
+        if scheduler is None:
+            self.flush()
+        elif schedule:
+            scheduler(self.delay, self.flush)
+
+    def delete(self, service, key):
+        """
+        Deletes a saved value (later).
+        :param service: Name of the service in the keyring.
+        :type service: str
+        :param key: Name of the value.
+        :type key: str
+        """
+        self.set(service, key, None)
+
+    @property
+    def pending(self):
+        """
+        Number of changes waiting to be saved.
+        """
+        with self.__lock:
+            return len(self.__dirty)
+
+    def flush(self):
+        """
+        Saves the pending changes in the keyring. Errors of the keyring are
+        reported with sys.excepthook and the value is not saved.
+        """
+        with self.__flush_lock:
+            with self.__lock:
+                dirty = self.__dirty
+                self.__dirty = {}
+                self.__flush_scheduled = False
+
+            if dirty:
+                keyring = vault.get_keyring()
+            for (service, key), value in dirty.items():
+                try:
+                    if value is None:
+                        try:
+                            keyring.delete_password(service, key)
+                        except keyring.errors.PasswordDeleteError:
+                            # It wasn't saved
+                            pass
+                    else:
+                        keyring.set_password(service, key, value)
+                except Exception:
+                    sys.excepthook(*sys.exc_info())
+                with self.__lock:
+                    self.writes += 1
+
+
+default_store = TokenStore()
@@ -3,9 +3,14 @@
 Package containing utility functions for the backend.
 """
 
+import hashlib
 import re
 from urllib.parse import urlparse
 
+from requests.exceptions import ConnectionError, HTTPError, Timeout
+
+from .constants import Api, Http
+
 
 def urljoin(base, *parts):
     """
@@ -37,3 +42,39 @@ def is_url_valid(url, allowed_schemes):
     parsed = urlparse(url)
     is_valid = (parsed.scheme in allowed_schemes)
     return is_valid
+
+
+def is_transient(exception):
+    """
+    Checks if the error may disappear if the request is done again later:
+    the server could not be reached, took too long, is overloaded or failed
+    (5xx).
+    Returns if it is transient.
+
+    :param exception: The error of the request.
+    :type exception: Exception
+    """
+    if isinstance(exception, (ConnectionError, Timeout)):
+        return True
+    if isinstance(exception, HTTPError) and exception.response is not None:
+        status = exception.response.status_code
+        return (
+            status == Api.TOO_MANY_REQUESTS
+            or status in Api.SERVER_ERRORS
+        )
+    return False
+
+
+def file_digest(path):
+    """
+    Returns the hex SHA-256 digest of the contents of a file. It is read in
+    chunks.
+
+    :param path: Path of the file.
+    :type path: str
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(Http.CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""
+Lazy access to the keyring (the vault where the tokens are saved).
+Importing keyring chooses its backend, which scans the installed plugins and
+probes every backend (ie. connecting to the Secret Service through D-Bus).
+It is imported the first time the vault is used, so it can be done in the
+background. The bundled keyring always runs that discovery when it is
+imported, so it can be moved off the GUI thread but not skipped.
+"""
+
+import threading
+
+_lock = threading.Lock()
+_keyring = None
+
+
+def get_keyring():
+    """
+    Returns the keyring module, loading it and its backend the first time.
+    Concurrent calls wait for the first one.
+    """
+    global _keyring
+    with _lock:
+        if _keyring is None:
+            import keyring
+            import keyring.errors
+
+            _keyring = keyring
+        return _keyring
+
+
+def is_loaded():
+    """
+    Has the keyring been loaded?
+    """
+    return _keyring is not None
+
+
+def backend_name():
+    """
+    Returns the full name of the class of the keyring's backend, loading it
+    if needed.
+    """
+    return _name(get_keyring().get_keyring())
+
+
+def _name(backend):
+    cls = type(backend)
+    return cls.__module__ + '.' + cls.__qualname__
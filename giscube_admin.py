@@ -6,15 +6,22 @@ This script contains GiscubeAdmin: the plugin's main class.
 import os.path
 import time
 
+from requests.exceptions import RequestException
+
 from PyQt5.QtCore import QSettings, QDir, Qt, \
                          QTranslator, qVersion, QCoreApplication
 from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import QAction
 
-from qgis.core import Qgis, QgsProject
+from qgis.core import Qgis, QgsProject, QgsMessageLog
 from qgis.gui import QgsMessageBar
 
-from .backend import Giscube
+from .backend import Giscube, vault
+from .backend.exceptions import Unauthorized
+from .backend.token_store import default_store
+
+from .async import FunctionJob, Priority
+from .main_company import main_company
 
 from .settings import Settings
 
@@ -54,6 +61,8 @@ class GiscubeAdmin:
 
         # initialize and load settings
         self.settings = Settings()
+        self.settings.apply_trace_jobs()
+        self.load_keyring()
 
         # initialize locale
         locale = QSettings().value('locale/userLocale')[0:2]
@@ -77,6 +86,7 @@ class GiscubeAdmin:
 
         self.pluginIsActive = False
         self.dockwidget = None
+        self.dock_open_time = None
 
         def load():
             if self.settings.is_open:
@@ -84,6 +94,13 @@ class GiscubeAdmin:
 
         iface.initializationCompleted.connect(load)
 
+    def load_keyring(self):
+        """
+        Loads the keyring in the background, so its backend is chosen before
+        the tokens are needed.
+        """
+        main_company.submit(vault.get_keyring)
+
     def server_names(self):
         """
         Names of the currently connected servers.
@@ -224,6 +241,17 @@ class GiscubeAdmin:
         # remove the toolbar
         del self.toolbar
 
+        # upload the pending saves and close the connections to the servers
+        if self.servers is not None:
+            for i in range(self.servers.topLevelItemCount()):
+                server_item = self.servers.topLevelItem(i)
+                server_item.flush_uploads()
+                server_item.giscube.close()
+
+        # save the pending tokens and finish the idle background threads
+        default_store.flush()
+        main_company.shutdown()
+
         if self.dockwidget is not None:
             self.dockwidget.hide()
             self.iface.removeDockWidget(self.dockwidget)
@@ -240,6 +268,7 @@ class GiscubeAdmin:
             # dockwidget may not exist if:
             #    first run of plugin
             #    removed on close (see self.onClosePlugin method)
+            start = time.perf_counter()
             if self.dockwidget is None:
                 self.make_dockwidget()
 
@@ -249,11 +278,20 @@ class GiscubeAdmin:
             # show the dockwidget
             self.iface.addDockWidget(Qt.RightDockWidgetArea, self.dockwidget)
 
+            self.dock_open_time = time.perf_counter() - start
+            QgsMessageLog.logMessage(
+                'Dock opened in {:.0f} ms'.format(self.dock_open_time * 1000),
+                'Giscube Admin',
+                Qgis.Info,
+            )
+
         self.dockwidget.show()
 
     def make_dockwidget(self):
         """
         Makes and configures the plugin to make the dockwidget.
+        The saved servers are shown at once, their saved tokens are loaded
+        in the background (in parallel, see Giscube.load_tokens).
         """
         # Create the dockwidget (after translation) and keep reference
         self.dockwidget = GiscubeAdminDockWidget(self)
@@ -266,8 +304,14 @@ class GiscubeAdmin:
                 self.CLIENT_ID,
                 False,
                 name,
+                load_tokens=False,
             )
-            ServerItem(conn, self.servers, self)
+            si = ServerItem(conn, self.servers, self)
+            main_company.list_job(FunctionJob(
+                main_company,
+                conn.load_tokens,
+                lane=si.lane,
+            ))
 
     def new_server_popup(self):
         """
@@ -332,10 +376,31 @@ class GiscubeAdmin:
             server = self.servers.topLevelItem(server_index)
 
             project_name = dialog.name.text()
-            project_id = server.giscube.qgis_server.upload_project(
-                None,
-                project_name,
-                path)
+            job = FunctionJob(
+                main_company,
+                server.giscube.qgis_server.upload_project,
+                (None, project_name, path),
+                priority=Priority.INTERACTIVE,
+                lane=server.lane,
+            )
+            if not server.list_job(job):
+                return
 
-            project = ProjectItem(project_id, project_name, server)
-            project.open()
+            def uploaded(future):
+                if future.cancelled():
+                    return
+                try:
+                    project_id = future.result()
+                except (Unauthorized, RequestException) as e:
+                    message = "Couldn't upload the project"
+                    if isinstance(e, Unauthorized):
+                        message += ", log in again"
+                    self.iface.messageBar().pushMessage(
+                        "Error",
+                        message,
+                        QgsMessageBar.ERROR
+                    )
+                    return
+                project = ProjectItem(project_id, project_name, server)
+                project.open()
+            job.future.add_done_callback(uploaded)
@@ -3,6 +3,29 @@
 This script contains the main .async.Company of the plugin.
 """
 
-from .async import Company
+from .async import Company, FunctionJob, Priority
+from .backend.timeouts import deadline
+from .backend.token_store import default_store
 
-main_company = Company(1)
+# Maximum number of jobs working at the same time against a single server
+SERVER_SLAVES = 2
+# Maximum number of jobs waiting for a single server. More are rejected
+SERVER_QUEUE_JOBS = 32
+
+# Priority gained by a waiting job each second: a background job waiting for
+#  20 s goes before the new normal ones
+AGING = 0.5
+
+main_company = Company(
+    max_slaves=8,
+    default_lane_slaves=SERVER_SLAVES,
+    aging=AGING,
+    # The requests of a job are limited by its deadline
+    job_context=lambda job: deadline(job.time_left),
+)
+
+# The tokens are saved in the keyring by a background job
+default_store.scheduler = lambda delay, flush: main_company.schedule(
+    FunctionJob(main_company, flush, priority=Priority.BACKGROUND),
+    delay,
+)
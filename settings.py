@@ -5,6 +5,8 @@ This script contains the plugin's settings logic and defaults.
 
 from PyQt5.QtCore import QSettings
 
+from .async import Tracer
+from .main_company import main_company
 from .ui.giscube_admin_configure_dialog import GiscubeAdminConfigureDialog
 
 
@@ -16,6 +18,8 @@ class Settings:
     UI_PREFIX = 'ui/'
 
     IS_OPEN_SETTING = SETTINGS_PREFIX + UI_PREFIX + 'is_open'
+    TRACE_JOBS_SETTING = SETTINGS_PREFIX + 'trace_jobs'
+    REFRESH_INTERVAL_SETTING = SETTINGS_PREFIX + 'refresh_interval'
 
     def __init__(self):
         self.__settings = QSettings(
@@ -35,10 +39,50 @@ class Settings:
         self.__settings.setValue(self.IS_OPEN_SETTING, v)
         self.__settings.sync()
 
+    @property
+    def refresh_interval(self):
+        """
+        Minutes between the background refreshes of the projects lists of
+        the expanded servers. 0 disables them.
+        """
+        return int(self.__settings.value(self.REFRESH_INTERVAL_SETTING, 5))
+
+    @refresh_interval.setter
+    def refresh_interval(self, v):
+        self.__settings.setValue(self.REFRESH_INTERVAL_SETTING, v)
+        self.__settings.sync()
+
+    @property
+    def trace_jobs(self):
+        """
+        Are the background jobs traced? See .async.Tracer.
+        """
+        v = self.__settings.value(self.TRACE_JOBS_SETTING, 'f')
+        if isinstance(v, str):
+            return v[0] in ['t', 'T']
+        else:
+            return v
+
+    @trace_jobs.setter
+    def trace_jobs(self, v):
+        self.__settings.setValue(self.TRACE_JOBS_SETTING, v)
+        self.__settings.sync()
+        self.apply_trace_jobs()
+
+    def apply_trace_jobs(self):
+        """
+        Starts or stops tracing the main company's jobs.
+        """
+        if not self.trace_jobs:
+            main_company.tracer = None
+        elif main_company.tracer is None:
+            main_company.tracer = Tracer()
+
     def edit_popup(self):
         """
         Executes a popup that allows to modify the settings.
         """
         dialog = GiscubeAdminConfigureDialog(self)
         if dialog.exec_():
-            pass
+            self.refresh_interval = dialog.refresh_interval.value()
+            self.trace_jobs = dialog.trace_jobs.isChecked()
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""
+This script contains a Job class for testing the async package.
+"""
+
+from async import Job
+
+
+class NoopJob(Job):
+    def __init__(self, priority=0.0, counter=None, event=None):
+        super(NoopJob, self).__init__(priority)
+        self.counter = counter
+        self.event = event
+
+    def do_work(self):
+        if self.counter is not None:
+            self.counter.append(None)
+        if self.event is not None:
+            self.event.set()
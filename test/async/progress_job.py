@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""
+This script contains a Job class for testing the async package.
+"""
+import time
+
+from async import Job
+
+
+class ProgressJob(Job):
+    def __init__(self, steps):
+        super(ProgressJob, self).__init__()
+        self.steps = steps
+        self.progress = []
+
+    def do_work(self):
+        for i in range(1, self.steps + 1):
+            self.report_progress(i, self.steps)
+        time.sleep(0.1)
+
+    def progress_changed(self, done, total):
+        self.progress.append((done, total))
@@ -4,10 +4,17 @@ This script tests the async package.
 """
 
 import time
+from concurrent.futures import CancelledError, wait
+from contextlib import contextmanager
 from unittest import TestCase
 
-from async import Company
+from async import Company, CancellationToken, DependencyFailed, FunctionJob, \
+    Overflow, Priority, QueueFull, RetryPolicy, Tracer
+from async.tracer import Outcome
+from async.job_queue import JobQueue
 from .append_job import AppendJob
+from .noop_job import NoopJob
+from .progress_job import ProgressJob
 from .sleep_job import SleepJob
 
 
@@ -23,3 +30,482 @@ class TestAsync(TestCase):
         time.sleep(3)
 
         self.assertEqual(len(l), 1)
+
+    def test_order(self):
+        queue = JobQueue()
+        jobs = [
+            NoopJob(priority=0.0),
+            NoopJob(priority=1.0),
+            NoopJob(priority=0.0),
+            NoopJob(priority=2.0),
+            NoopJob(priority=1.0),
+        ]
+        for job in jobs:
+            queue.push(job)
+
+        expected = [jobs[3], jobs[1], jobs[4], jobs[0], jobs[2]]
+        self.assertEqual([queue.pop() for _ in jobs], expected)
+        self.assertIsNone(queue.pop())
+
+    def test_priority_classes(self):
+        queue = JobQueue()
+        jobs = [
+            NoopJob(priority=Priority.NORMAL),
+            NoopJob(priority=Priority.INTERACTIVE + 1.0),
+            NoopJob(priority=Priority.BACKGROUND),
+            NoopJob(priority=Priority.INTERACTIVE),
+        ]
+        for job in jobs:
+            queue.push(job)
+
+        expected = [jobs[1], jobs[3], jobs[0], jobs[2]]
+        self.assertEqual([queue.pop() for _ in jobs], expected)
+
+    def test_aging(self):
+        queue = JobQueue(aging=100.0)
+        old = NoopJob(priority=Priority.BACKGROUND)
+        queue.push(old)
+        time.sleep(0.5)
+        new = NoopJob(priority=Priority.NORMAL)
+        queue.push(new)
+        interactive = NoopJob(priority=Priority.INTERACTIVE)
+        queue.push(interactive)
+
+        # Aging never passes the interactive jobs
+        self.assertEqual([queue.pop() for _ in range(3)],
+                         [interactive, old, new])
+
+    def test_preemption(self):
+        company = Company(max_slaves=1)
+
+        l = []
+
+        def background():
+            for _ in range(20):
+                job.yield_point()
+                time.sleep(0.1)
+            l.append('background')
+
+        job = FunctionJob(company, background, priority=Priority.BACKGROUND)
+        company.list_job(job)
+        time.sleep(0.5)
+        interactive = FunctionJob(company, l.append, ('interactive',),
+                                  priority=Priority.INTERACTIVE)
+        company.list_job(interactive)
+
+        interactive.future.result(timeout=1)
+        self.assertFalse(job.future.done())
+        job.future.result(timeout=5)
+        self.assertEqual(l, ['interactive', 'background'])
+        self.assertEqual(company.preempted_jobs, 1)
+
+        company.shutdown()
+
+    def test_reuse(self):
+        company = Company(max_slaves=1, idle_timeout=5000)
+
+        l = []
+        company.list_job(AppendJob(l, 'hello'))
+        time.sleep(1.5)
+        company.list_job(AppendJob(l, 'world'))
+        time.sleep(1.5)
+
+        self.assertEqual(l, ['hello', 'world'])
+        self.assertEqual(company.spawned_slaves, 1)
+        self.assertEqual(company.reused_slaves, 1)
+
+        company.shutdown()
+
+    def test_idle_timeout(self):
+        company = Company(max_slaves=1, idle_timeout=100)
+
+        company.list_job(SleepJob(t=0))
+        time.sleep(1)
+
+        self.assertEqual(company.spawned_slaves, 1)
+        self.assertEqual(len(company._slaves), 0)
+
+    def test_free_scheduled_slaves(self):
+        company = Company(max_slaves=1, idle_timeout=100)
+
+        # Slaves started from the timer thread
+        for _ in range(3):
+            company.schedule(SleepJob(t=0), 0)
+            time.sleep(1)
+
+        self.assertEqual(company.spawned_slaves, 3)
+        self.assertLessEqual(len(company._free_slaves), 1)
+        company.shutdown()
+
+    def test_lanes(self):
+        company = Company(max_slaves=2)
+        company.add_lane('a', 1)
+
+        l = []
+        slow = SleepJob(t=2)
+        slow.lane = 'a'
+        company.list_job(slow)
+
+        blocked = AppendJob(l, 'a')
+        blocked.lane = 'a'
+        company.list_job(blocked)
+
+        free = AppendJob(l, 'b')
+        free.lane = 'b'
+        company.list_job(free)
+
+        time.sleep(1.5)
+        self.assertEqual(l, ['b'])
+
+        time.sleep(2)
+        self.assertEqual(l, ['b', 'a'])
+
+        company.shutdown()
+
+    def test_reject(self):
+        company = Company(max_slaves=1)
+        company.add_lane('a', 1, max_jobs=1, overflow=Overflow.REJECT)
+        busy = SleepJob(t=1)
+        busy.lane = 'a'
+        company.list_job(busy)
+        time.sleep(0.5)
+
+        l = []
+        listed = AppendJob(l, 'listed')
+        listed.lane = 'a'
+        company.list_job(listed)
+        rejected = AppendJob(l, 'rejected')
+        rejected.lane = 'a'
+        with self.assertRaises(QueueFull):
+            company.list_job(rejected)
+
+        time.sleep(2)
+        self.assertEqual(l, ['listed'])
+        self.assertEqual(company.rejected_jobs, 1)
+
+        company.shutdown()
+
+    def test_drop_oldest(self):
+        company = Company(max_slaves=1)
+        company.add_lane('a', 1, max_jobs=1, overflow=Overflow.DROP_OLDEST)
+        busy = SleepJob(t=1)
+        busy.lane = 'a'
+        company.list_job(busy)
+        time.sleep(0.5)
+
+        oldest = FunctionJob(company, time.sleep, (0,), lane='a')
+        company.list_job(oldest)
+        newest = FunctionJob(company, time.sleep, (0,), lane='a')
+        company.list_job(newest)
+
+        with self.assertRaises(QueueFull):
+            oldest.future.result(timeout=1)
+        self.assertIsNone(newest.future.result(timeout=5))
+        self.assertEqual(company.dropped_jobs, 1)
+
+        company.shutdown()
+
+    def test_block(self):
+        company = Company(max_slaves=1)
+        company.add_lane('a', 1, max_jobs=1, block_timeout=3000)
+        busy = SleepJob(t=1)
+        busy.lane = 'a'
+        company.list_job(busy)
+        time.sleep(0.5)
+
+        first = FunctionJob(company, time.sleep, (1,), lane='a')
+        company.list_job(first)
+        start = time.time()
+        company.list_job(FunctionJob(company, time.sleep, (0,), lane='a'))
+        # Blocked until the busy job finished and the first one was taken
+        self.assertGreater(time.time() - start, 0.3)
+
+        company.add_lane('a', 1, max_jobs=1, block_timeout=100)
+        with self.assertRaises(QueueFull):
+            company.list_job(FunctionJob(company, time.sleep, (0,), lane='a'))
+        self.assertEqual(company.rejected_jobs, 1)
+
+        company.shutdown()
+
+    def test_coalesce(self):
+        company = Company(max_slaves=1)
+        company.list_job(SleepJob(t=1))
+
+        l = []
+        first = AppendJob(l, 'first')
+        first.coalesce_key = 'append'
+        second = AppendJob(l, 'second')
+        second.coalesce_key = 'append'
+
+        self.assertIs(company.list_job(first), first)
+        self.assertIs(company.list_job(second), first)
+
+        time.sleep(3)
+        self.assertEqual(l, ['first'])
+
+        company.shutdown()
+
+    def test_cancel(self):
+        company = Company(max_slaves=1)
+        company.list_job(SleepJob(t=1))
+
+        token = CancellationToken()
+        l = []
+        cancelled = AppendJob(l, 'cancelled')
+        cancelled.token = token
+        company.list_job(cancelled)
+        company.list_job(AppendJob(l, 'kept'))
+        token.cancel()
+
+        time.sleep(3)
+        self.assertEqual(l, ['kept'])
+
+        company.shutdown()
+
+    def test_cancel_parent(self):
+        parent = CancellationToken()
+        alone = CancellationToken(parent)
+        child = CancellationToken(parent)
+
+        alone.cancel()
+        self.assertTrue(alone.is_cancelled)
+        self.assertFalse(child.is_cancelled)
+        self.assertFalse(parent.is_cancelled)
+
+        parent.cancel()
+        self.assertTrue(child.is_cancelled)
+
+    def test_future(self):
+        company = Company(max_slaves=2)
+
+        def add(a, b):
+            time.sleep(0.5)
+            return a + b
+
+        future = company.submit(add, 1, 2)
+        chained = future.then(add, 3)
+        self.assertEqual(future.result(timeout=5), 3)
+        self.assertEqual(chained.result(timeout=5), 6)
+
+        failed = company.submit(add, 1, None).then(add, 3)
+        with self.assertRaises(TypeError):
+            failed.result(timeout=5)
+
+        futures = [company.submit(add, i, i) for i in range(4)]
+        done, not_done = wait(futures, timeout=5)
+        self.assertEqual(len(done), 4)
+        self.assertEqual(sorted(f.result() for f in done), [0, 2, 4, 6])
+
+        company.shutdown()
+
+    def test_future_cancel(self):
+        company = Company(max_slaves=1)
+        company.list_job(SleepJob(t=1))
+
+        queued = FunctionJob(company, time.sleep, (0,))
+        company.list_job(queued)
+        delivered = []
+        queued.future.add_done_callback(delivered.append)
+        queued.cancel()
+
+        with self.assertRaises(CancelledError):
+            queued.future.result(timeout=5)
+        self.assertTrue(queued.future.cancelled())
+
+        company.list_job(SleepJob(t=1))
+        future = company.submit(time.sleep, 0)
+        self.assertTrue(future.cancel())
+        self.assertTrue(future.job.is_cancelled)
+
+        time.sleep(1.5)
+        company.dispatcher._dispatch()
+        self.assertEqual(delivered, [queued.future])
+
+        company.shutdown()
+
+    def test_dependencies(self):
+        company = Company(max_slaves=2)
+
+        l = []
+        a = AppendJob(l, 'a')
+        b = AppendJob(l, 'b')
+        b.depends_on = [a]
+        c = AppendJob(l, 'c')
+        c.depends_on = [a]
+        d = AppendJob(l, 'd')
+        d.depends_on = [b, c]
+
+        for job in [d, c, b, a]:
+            company.list_job(job)
+
+        # a, then b and c at the same time, then d
+        time.sleep(2.5)
+        self.assertEqual(l[0], 'a')
+        self.assertEqual(sorted(l[1:]), ['b', 'c'])
+        time.sleep(1.5)
+        self.assertEqual(l[3:], ['d'])
+
+        company.shutdown()
+
+    def test_dependency_failed(self):
+        company = Company(max_slaves=2)
+
+        def fail():
+            raise ValueError()
+
+        failed = company.submit(fail)
+        dependent = FunctionJob(company, lambda: 'run')
+        dependent.depends_on = [failed.job]
+        company.list_job(dependent)
+
+        with self.assertRaises(DependencyFailed):
+            dependent.future.result(timeout=5)
+
+        company.shutdown()
+
+    def test_dependency_merged(self):
+        company = Company(max_slaves=1)
+        company.list_job(SleepJob(t=1))
+
+        l = []
+        first = AppendJob(l, 'first')
+        first.coalesce_key = 'append'
+        merged = AppendJob(l, 'merged')
+        merged.coalesce_key = 'append'
+        company.list_job(first)
+        self.assertIs(company.list_job(merged), first)
+
+        dependent = AppendJob(l, 'dependent')
+        dependent.depends_on = [merged]
+        company.list_job(dependent)
+
+        time.sleep(4)
+        self.assertEqual(l, ['first', 'dependent'])
+
+        company.shutdown()
+
+    def test_retry(self):
+        company = Company(max_slaves=1)
+
+        l = []
+        attempts = []
+
+        def flaky():
+            attempts.append(time.time())
+            if len(attempts) < 3:
+                raise ConnectionError()
+            l.append('done')
+
+        job = FunctionJob(company, flaky)
+        job.retry = RetryPolicy(max_attempts=3, base=0.2, jitter=0.0)
+        company.list_job(job)
+
+        self.assertIsNone(job.future.result(timeout=5))
+        self.assertEqual(l, ['done'])
+        self.assertEqual(job.attempt, 3)
+        # Exponential backoff: 0.2 s and 0.4 s
+        self.assertGreaterEqual(attempts[2] - attempts[1], 0.35)
+
+        company.shutdown()
+
+    def test_deadline(self):
+        contexts = []
+
+        @contextmanager
+        def job_context(job):
+            contexts.append(job.time_left)
+            yield
+
+        company = Company(max_slaves=1, job_context=job_context)
+        company.tracer = Tracer()
+
+        def slow():
+            time.sleep(0.3)
+            raise TimeoutError()
+
+        job = FunctionJob(company, slow)
+        job.deadline = 0.1
+        company.list_job(job)
+
+        with self.assertRaises(TimeoutError):
+            job.future.result(timeout=5)
+        self.assertTrue(job.timed_out)
+        self.assertEqual(len(contexts), 1)
+        self.assertLessEqual(contexts[0], 0.1)
+        time.sleep(0.5)
+        company.dispatcher._dispatch()
+        self.assertEqual(company.tracer.outcomes, {Outcome.TIMED_OUT: 1})
+
+        company.shutdown()
+
+    def test_progress(self):
+        company = Company(max_slaves=1)
+
+        job = ProgressJob(1000)
+        company.list_job(job)
+        time.sleep(0.5)
+        company.dispatcher._dispatch()
+        # Only the last progress is delivered
+        self.assertEqual(job.progress, [(1000, 1000)])
+
+        cancelled = ProgressJob(10)
+        company.list_job(cancelled)
+        time.sleep(0.05)
+        cancelled.cancel()
+        time.sleep(0.5)
+        company.dispatcher._dispatch()
+        self.assertEqual(cancelled.progress, [])
+
+        company.shutdown()
+
+    def test_schedule(self):
+        company = Company(max_slaves=1)
+
+        l = []
+        company.schedule(AppendJob(l, 'later'), 0.5)
+        cancelled = company.schedule(AppendJob(l, 'cancelled'), 0.5)
+        cancelled.cancel()
+
+        time.sleep(1)
+        self.assertEqual(l, [])
+        time.sleep(1)
+        self.assertEqual(l, ['later'])
+
+        company.shutdown()
+
+    def test_schedule_rejected(self):
+        company = Company(max_slaves=1)
+        company.add_lane('a', 1, max_jobs=1, overflow=Overflow.REJECT)
+        busy = SleepJob(t=1)
+        busy.lane = 'a'
+        company.list_job(busy)
+        time.sleep(0.5)
+        listed = FunctionJob(company, time.sleep, (0,), lane='a')
+        company.list_job(listed)
+
+        scheduled = FunctionJob(company, time.sleep, (0,), lane='a')
+        company.schedule(scheduled, 0)
+        with self.assertRaises(QueueFull):
+            scheduled.future.result(timeout=1)
+        self.assertEqual(company.rejected_jobs, 1)
+
+        company.shutdown()
+
+    def test_schedule_every(self):
+        company = Company(max_slaves=2)
+
+        l = []
+        handle = company.schedule_every(
+            lambda: FunctionJob(company, l.append, (None,)),
+            0.2,
+        )
+        time.sleep(1.1)
+        handle.cancel()
+        time.sleep(0.5)
+
+        self.assertIn(len(l), range(4, 7))
+        count = len(l)
+        time.sleep(0.5)
+        self.assertEqual(len(l), count)
+
+        company.shutdown()
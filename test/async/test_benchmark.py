@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+This script benchmarks the job queue of the async package. It is skipped
+unless the BENCHMARK environment variable is set (see make benchmark).
+"""
+
+import os
+import threading
+import time
+from unittest import TestCase, skipUnless
+
+from async import Company
+from async.job_queue import JobQueue
+from .noop_job import NoopJob
+
+JOBS = 100000
+
+
+@skipUnless(os.environ.get('BENCHMARK'), 'set BENCHMARK=1 to run it')
+class TestBenchmark(TestCase):
+    def report(self, name, seconds):
+        print('{}: {} jobs in {:.3f} s ({:.0f} jobs/s)'.format(
+            name, JOBS, seconds, JOBS / seconds))
+
+    def test_queue(self):
+        queue = JobQueue()
+        jobs = [NoopJob(priority=i % 3) for i in range(JOBS)]
+
+        start = time.perf_counter()
+        for job in jobs:
+            queue.push(job)
+        self.report('enqueue', time.perf_counter() - start)
+
+        start = time.perf_counter()
+        while queue.pop() is not None:
+            pass
+        self.report('dequeue', time.perf_counter() - start)
+
+    def test_company(self):
+        company = Company(max_slaves=1)
+        counter = []
+        done = threading.Event()
+
+        # Keep the slave busy until everything is listed
+        start_event = threading.Event()
+        company.list_job(_WaitJob(start_event))
+
+        start = time.perf_counter()
+        for i in range(JOBS - 1):
+            company.list_job(NoopJob(priority=1.0, counter=counter))
+        company.list_job(NoopJob(priority=0.0, counter=counter, event=done))
+        self.report('list_job', time.perf_counter() - start)
+
+        start = time.perf_counter()
+        start_event.set()
+        self.assertTrue(done.wait(120))
+        self.report('dispatch', time.perf_counter() - start)
+
+        self.assertEqual(len(counter), JOBS)
+
+        company.shutdown()
+
+
+class _WaitJob(NoopJob):
+    def __init__(self, event):
+        super(_WaitJob, self).__init__(priority=2.0)
+        self.wait_event = event
+
+    def do_work(self):
+        self.wait_event.wait()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+This script tests the dispatcher of the async package.
+"""
+
+import time
+from unittest import TestCase
+
+from async import Dispatcher, Job
+
+
+class ChunkedJob(Job):
+    def __init__(self, l, chunks, t=0.0):
+        super(ChunkedJob, self).__init__()
+        self.list = l
+        self.chunks = chunks
+        self.t = t
+
+    def apply_result(self):
+        for i in range(self.chunks):
+            time.sleep(self.t)
+            self.list.append(i)
+            yield
+
+
+class TestDispatcher(TestCase):
+    def test_chunks(self):
+        dispatcher = Dispatcher(frame_budget=50)
+
+        l = []
+        dispatcher.post(ChunkedJob(l, 10, t=0.02))
+        dispatcher._dispatch()
+
+        # The budget was spent before all the chunks were applied
+        self.assertGreater(len(l), 0)
+        self.assertLess(len(l), 10)
+
+        while len(l) < 10:
+            dispatcher._dispatch()
+        self.assertEqual(l, list(range(10)))
+
+    def test_cancelled(self):
+        dispatcher = Dispatcher()
+
+        l = []
+        job = ChunkedJob(l, 3)
+        job.cancel()
+        dispatcher.post(job)
+        dispatcher.post(ChunkedJob(l, 1))
+        dispatcher._dispatch()
+
+        self.assertEqual(l, [0])
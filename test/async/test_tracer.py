@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+This script tests the tracer of the async package.
+"""
+
+import time
+from unittest import TestCase
+
+from async import Company, Tracer
+from .sleep_job import SleepJob
+
+
+class TestTracer(TestCase):
+    def test_trace(self):
+        company = Company(max_slaves=1)
+        company.tracer = Tracer()
+
+        company.list_job(SleepJob(t=0.2))
+        company.list_job(SleepJob(t=0.2))
+        time.sleep(1)
+        company.dispatcher._dispatch()
+
+        trace = company.tracer.chrome_trace()
+        names = [e['cat'] for e in trace['traceEvents'] if e['ph'] == 'X']
+        self.assertEqual(sorted(names), ['apply'] * 2 + ['queue'] * 2 +
+                         ['run'] * 2)
+
+        summary = trace['otherData']
+        self.assertEqual(summary['outcomes'], {'done': 2})
+        self.assertEqual(summary['histograms']['run']['count'], 2)
+        # The second job waited for the first one
+        self.assertGreaterEqual(
+            summary['histograms']['queue_wait']['max_ms'], 150)
+
+        company.shutdown()
+
+    def test_disabled(self):
+        company = Company(max_slaves=1)
+
+        job = SleepJob(t=0)
+        company.list_job(job)
+        time.sleep(0.5)
+
+        self.assertIsNone(job._trace)
+
+        company.shutdown()
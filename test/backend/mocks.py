@@ -3,6 +3,7 @@
 File that contains all the mock classes for the unit test.
 """
 
+import json
 import logging
 import sys
 
@@ -28,15 +29,24 @@ class MockResponse:
     def __init__(self, data, status_code):
         self.data = data
         self.status_code = status_code
+        self.headers = {}
 
     def json(self):
         return self.data
 
+    def iter_content(self, chunk_size=1):
+        content = json.dumps(self.data).encode('utf-8')
+        for i in range(0, len(content), chunk_size):
+            yield content[i:i+chunk_size]
+
     def raise_for_status(self):
         pass
 
+    def close(self):
+        pass
+
 
-def mocked_get(url, params):
+def mocked_get(url, params, headers=None, stream=False):
     logger.debug('---------------------')
     logger.info('Mocked get')
     logger.debug(url)
@@ -62,7 +72,7 @@ def mocked_get(url, params):
             return MockResponse({}, Api.UNAUTHORIZED)
 
 
-def mocked_post(url='', params='', data=''):
+def mocked_post(url='', params='', data='', headers=None):
     logger.debug('---------------------')
     logger.info('Mocked post')
     logger.debug(url)
@@ -80,7 +90,7 @@ def mocked_post(url='', params='', data=''):
             return MockResponse({}, Api.UNAUTHORIZED)
 
 
-def mocked_put(url='', params='', data=''):
+def mocked_put(url='', params='', data='', headers=None):
     logger.info('---------------------')
     logger.info('Mocked put')
     logger.info(url)
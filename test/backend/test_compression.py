@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+Test units for the package backend.compression.
+"""
+
+import gzip
+import io
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from requests.exceptions import HTTPError
+
+from .constants import Test
+from backend.compression import CompressedBody, TransferStats
+from backend.giscube import Giscube
+
+from .mocks import MockResponse
+
+
+class MockPlainServer:
+    """
+    Projects endpoint that doesn't accept compressed requests.
+    """
+    def __init__(self, status=415, plain_status=200):
+        self.status = status
+        self.plain_status = plain_status
+        self.bodies = []
+
+    def put(self, url='', params='', data='', headers=None):
+        # The credentials are readable even if the body isn't
+        assert params['access_token'] == 'test'
+        self.bodies.append(headers.get('Content-Encoding'))
+        status = self.status if headers.get('Content-Encoding') else \
+            self.plain_status
+        if status >= 400:
+            response = MockResponse({}, status)
+
+            def raise_for_status():
+                raise HTTPError(response=response)
+            response.raise_for_status = raise_for_status
+            response.close = lambda: None
+            return response
+        return MockResponse({'id': 7}, 200)
+
+
+class TestCompression(TestCase):
+    def test_compressed_body(self):
+        content = b'<qgis><layer/></qgis>' * 10000
+        progress = []
+        body = CompressedBody(
+            io.BytesIO(content),
+            lambda sent, total: progress.append((sent, total)),
+        )
+        compressed = b''.join(body)
+        body.close()
+
+        self.assertEqual(gzip.decompress(compressed), content)
+        self.assertEqual(len(compressed), len(body))
+        self.assertLess(len(body), len(content) / 10)
+        self.assertEqual(progress[-1], (len(body), len(body)))
+
+    def test_stats(self):
+        stats = TransferStats()
+        stats.add_sent(100, 1000)
+        stats.add_received(50, 500)
+        stats.add_received(10, 10)
+        self.assertEqual(stats.sent_content, 1000)
+        self.assertEqual(stats.received, 60)
+        self.assertEqual(stats.saved, 1350)
+
+    def upload(self, server, compress_uploads=True, changes=1):
+        fd, path = tempfile.mkstemp('.qgs')
+        with os.fdopen(fd, 'w') as f:
+            f.write('<qgis><layer/></qgis>' * 1000)
+
+        with mock.patch('requests.Session.put',
+                        mock.Mock(side_effect=server.put)):
+            giscube = Giscube(Test.URL, Test.CLIENT_ID, False,
+                              load_tokens=False,
+                              compress_uploads=compress_uploads)
+            giscube._Giscube__access_token = 'test'
+
+            qgis_server = giscube.qgis_server
+            try:
+                for _ in range(changes):
+                    with open(path, 'a') as f:
+                        f.write('<qgis/>')
+                    self.assertEqual(qgis_server.upload_project(7, 'p', path),
+                                     7)
+            finally:
+                os.remove(path)
+        return giscube
+
+    def test_fallback(self):
+        server = MockPlainServer()
+        giscube = self.upload(server, changes=2)
+
+        # Compressed, rejected, sent again uncompressed and not compressed
+        #  any more
+        self.assertEqual(server.bodies, ['gzip', None, None])
+        self.assertFalse(giscube.compress_uploads)
+        self.assertEqual(giscube.transfer_stats.saved, 0)
+
+    def test_unreadable_body(self):
+        # Servers that can't read the body don't find the project fields
+        for status in (400, 401):
+            server = MockPlainServer(status)
+            giscube = self.upload(server, changes=2)
+            self.assertEqual(server.bodies, ['gzip', None, None])
+            self.assertFalse(giscube.compress_uploads)
+
+    def test_bad_request(self):
+        server = MockPlainServer(400, 400)
+        with self.assertRaises(HTTPError):
+            self.upload(server)
+
+        # Also rejected uncompressed: it is not about the compression
+        self.assertEqual(server.bodies, ['gzip', None])
+
+    def test_opt_in(self):
+        server = MockPlainServer()
+        giscube = self.upload(server, compress_uploads=False)
+        self.assertEqual(server.bodies, [None])
+        self.assertFalse(giscube.compress_uploads)
@@ -13,7 +13,7 @@ from .mocks import mocked_post
 
 class TestGiscube(TestCase):
 
-    @mock.patch('requests.post', mocked_post)
+    @mock.patch('requests.Session.post', mock.Mock(side_effect=mocked_post))
     def test_properties(self):
         giscube = Giscube(Test.URL, Test.CLIENT_ID, False)
         self.assertEqual(giscube.server_url, Test.URL)
@@ -23,7 +23,7 @@ class TestGiscube(TestCase):
         self.assertIsNone(giscube.access_token)
         self.assertFalse(giscube.has_refresh_token)
 
-    @mock.patch('requests.post', mocked_post)
+    @mock.patch('requests.Session.post', mock.Mock(side_effect=mocked_post))
     def test_get_refresh(self):
         giscube = Giscube(Test.URL, Test.CLIENT_ID, False)
 
@@ -47,7 +47,7 @@ class TestGiscube(TestCase):
 
         self.assertNotEqual(old_access_token, giscube.access_token)
 
-    @mock.patch('requests.post', mocked_post)
+    @mock.patch('requests.Session.post', mock.Mock(side_effect=mocked_post))
     def test_saving_loading(self):
         giscube = Giscube(
             Test.URL,
@@ -77,3 +77,14 @@ class TestGiscube(TestCase):
         self.assertFalse(giscube.is_logged_in)
         self.assertIsNone(giscube.access_token)
         self.assertFalse(giscube.has_refresh_token)
+
+    def test_session(self):
+        giscube = Giscube(
+            Test.URL,
+            Test.CLIENT_ID,
+            False,
+            pool_maxsize=2)
+        adapter = giscube.session.get_adapter('https://server.example')
+        self.assertEqual(adapter._pool_maxsize, 2)
+        self.assertIs(giscube.session, giscube.qgis_server.giscube.session)
+        giscube.close()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+Test units for the package backend.health.
+"""
+
+import time
+from unittest import TestCase, mock
+
+from requests.exceptions import ConnectionError, InvalidURL
+
+from .constants import Test
+from backend.giscube import Giscube
+from backend.health import CircuitOpen, ServerHealth
+
+from .mocks import mocked_post
+
+
+class TestServerHealth(TestCase):
+    def test_circuit(self):
+        health = ServerHealth(failure_threshold=2, reset_timeout=0.1)
+        states = []
+        health.listener = states.append
+
+        health.before_request()
+        health.success(0.1)
+        health.before_request()
+        health.failure()
+        self.assertEqual(health.state, ServerHealth.CLOSED)
+        health.before_request()
+        health.failure()
+        self.assertEqual(health.state, ServerHealth.OPEN)
+        self.assertEqual(health.error_rate, 2 / 3)
+
+        with self.assertRaises(CircuitOpen):
+            health.before_request()
+
+        time.sleep(0.15)
+        # A single probe is let through
+        health.before_request()
+        self.assertEqual(health.state, ServerHealth.HALF_OPEN)
+        with self.assertRaises(CircuitOpen):
+            health.before_request()
+
+        health.failure()
+        self.assertEqual(health.state, ServerHealth.OPEN)
+
+        time.sleep(0.15)
+        health.before_request()
+        health.success(0.2)
+        self.assertEqual(health.state, ServerHealth.CLOSED)
+        self.assertAlmostEqual(health.latency, 0.12)
+
+        self.assertEqual(states, [
+            ServerHealth.OPEN,
+            ServerHealth.HALF_OPEN,
+            ServerHealth.OPEN,
+            ServerHealth.HALF_OPEN,
+            ServerHealth.CLOSED,
+        ])
+
+    @mock.patch('requests.Session.post', mock.Mock(side_effect=mocked_post))
+    def test_fail_fast(self):
+        giscube = Giscube(Test.URL, Test.CLIENT_ID, False)
+        giscube.health.failure_threshold = 2
+        make_request = mock.Mock(side_effect=ConnectionError())
+
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                giscube.try_request(make_request)
+        with self.assertRaises(CircuitOpen):
+            giscube.try_request(make_request)
+        self.assertEqual(make_request.call_count, 2)
+
+    @mock.patch('requests.Session.post', mock.Mock(side_effect=mocked_post))
+    def test_local_errors(self):
+        giscube = Giscube(Test.URL, Test.CLIENT_ID, False)
+        giscube.health.failure_threshold = 1
+        make_request = mock.Mock(side_effect=InvalidURL())
+
+        for _ in range(2):
+            with self.assertRaises(InvalidURL):
+                giscube.try_request(make_request)
+        self.assertEqual(giscube.health.state, ServerHealth.CLOSED)
+        self.assertEqual(make_request.call_count, 2)
+
+        # A probe that fails locally lets the next one through
+        health = ServerHealth(failure_threshold=1, reset_timeout=0.1)
+        health.before_request()
+        health.failure()
+        time.sleep(0.15)
+        health.before_request()
+        health.aborted()
+        health.before_request()
+        self.assertEqual(health.state, ServerHealth.HALF_OPEN)
@@ -3,26 +3,31 @@
 Test units for the package backend.qgis_server.
 """
 
+import glob
+import gzip
 from unittest import mock, TestCase
 
+from requests.exceptions import HTTPError
+
 from .constants import Test
 from backend.exceptions import Unauthorized
 from backend.giscube import Giscube
+from backend.utils import file_digest
 
-from .mocks import mocked_get, mocked_post, mocked_put
+from .mocks import MockResponse, mocked_get, mocked_post, mocked_put
 
 
 class TestGiscubeRequests(TestCase):
     @classmethod
-    @mock.patch('requests.post', mocked_post)
+    @mock.patch('requests.Session.post', mock.Mock(side_effect=mocked_post))
     def setUpClass(cls):
         giscube = Giscube(Test.URL, Test.CLIENT_ID, False)
         giscube.login(Test.USER, Test.PASSWORD)
         cls._giscube = giscube
 
-    @mock.patch('requests.get', mocked_get)
-    @mock.patch('requests.post', mocked_post)
-    @mock.patch('requests.put', mocked_put)
+    @mock.patch('requests.Session.get', mock.Mock(side_effect=mocked_get))
+    @mock.patch('requests.Session.post', mock.Mock(side_effect=mocked_post))
+    @mock.patch('requests.Session.put', mock.Mock(side_effect=mocked_put))
     def testUnauthorized(self):
         # token handler without any login
         giscube = Giscube(Test.URL, Test.CLIENT_ID, False)
@@ -40,9 +45,9 @@ class TestGiscubeRequests(TestCase):
                 Test.MOCK_PROJECT['name'],
                 '')
 
-    @mock.patch('requests.get', mocked_get)
-    @mock.patch('requests.post', mocked_post)
-    @mock.patch('requests.put', mocked_put)
+    @mock.patch('requests.Session.get', mock.Mock(side_effect=mocked_get))
+    @mock.patch('requests.Session.post', mock.Mock(side_effect=mocked_post))
+    @mock.patch('requests.Session.put', mock.Mock(side_effect=mocked_put))
     def testUpdateFile(self):
         qgis_server = self._giscube.qgis_server
         projects_list = qgis_server.projects()
@@ -54,3 +59,87 @@ class TestGiscubeRequests(TestCase):
 
         qgis_server.upload_project(project, Test.MOCK_PROJECT['name'], path)
         qgis_server.upload_project(None, Test.MOCK_PROJECT['name'], path)
+
+    @mock.patch('requests.Session.get', mock.Mock(side_effect=mocked_get))
+    def testSkipUnchanged(self):
+        qgis_server = self._giscube.qgis_server
+        project = Test.MOCK_PROJECT['id']
+        path = qgis_server.download_project(project)
+        self.assertFalse(qgis_server.is_modified(project, path))
+
+        put = mock.Mock(return_value=MockResponse({'id': project}, 200))
+        with mock.patch('requests.Session.put', put):
+            qgis_server.upload_project(project, Test.MOCK_PROJECT['name'], path)
+            self.assertEqual(put.call_count, 0)
+
+            with open(path, 'a') as f:
+                f.write('changed')
+            self.assertTrue(qgis_server.is_modified(project, path))
+            qgis_server.upload_project(project, Test.MOCK_PROJECT['name'], path)
+            self.assertEqual(put.call_count, 1)
+
+            self.assertFalse(qgis_server.is_modified(project, path))
+            qgis_server.upload_project(project, Test.MOCK_PROJECT['name'], path)
+            self.assertEqual(put.call_count, 1)
+
+    @mock.patch('requests.Session.get', mock.Mock(side_effect=mocked_get))
+    def testSaveWhileUploading(self):
+        qgis_server = self._giscube.qgis_server
+        project = Test.MOCK_PROJECT['id']
+        path = qgis_server.download_project(project)
+        with open(path, 'a') as f:
+            f.write('changed')
+        sent = []
+
+        def put(url='', params='', data='', headers=None):
+            body = b''.join(data)
+            if headers.get('Content-Encoding') == 'gzip':
+                body = gzip.decompress(body)
+            sent.append(body)
+            return MockResponse({'id': project}, 200)
+
+        def digest(file_path):
+            result = file_digest(file_path)
+            # Saved again after the upload started
+            with open(path, 'w') as f:
+                f.write('saved again')
+            return result
+
+        with mock.patch('requests.Session.put', mock.Mock(side_effect=put)), \
+                mock.patch('backend.qgis_server.file_digest', digest):
+            qgis_server.upload_project(
+                project, Test.MOCK_PROJECT['name'], path)
+
+        # The server has the contents before the last save
+        self.assertIn(b'changed', sent[0])
+        self.assertNotIn(b'saved again', sent[0])
+        self.assertTrue(qgis_server.is_modified(project, path))
+
+    @mock.patch('requests.Session.get', mock.Mock(side_effect=mocked_get))
+    def testCancelDownload(self):
+        qgis_server = self._giscube.qgis_server
+        pattern = qgis_server.WRITE_DIR + '/qgis-admin-project-*'
+        files = set(glob.glob(pattern))
+
+        class Stop(Exception):
+            pass
+
+        def progress(received, total):
+            raise Stop()
+
+        with self.assertRaises(Stop):
+            qgis_server.download_project(Test.MOCK_PROJECT['id'], progress)
+        self.assertEqual(set(glob.glob(pattern)), files)
+
+    def testDownloadErrorReleasesConnection(self):
+        qgis_server = self._giscube.qgis_server
+        response = MockResponse({}, 500)
+        response.close = mock.Mock()
+        response.raise_for_status = mock.Mock(
+            side_effect=HTTPError(response=response))
+
+        with mock.patch('requests.Session.get',
+                        mock.Mock(return_value=response)):
+            with self.assertRaises(HTTPError):
+                qgis_server.download_project(Test.MOCK_PROJECT['id'])
+        self.assertTrue(response.close.called)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+Test units for the package backend.streaming.
+"""
+
+import email
+import json
+import tempfile
+from unittest import TestCase
+
+from backend.streaming import MultipartBody, extract_field
+
+
+class TestStreaming(TestCase):
+    def extract(self, document, field='data', chunk_size=1, ensure_ascii=True):
+        content = json.dumps(document, ensure_ascii=ensure_ascii)
+        content = content.encode('utf-8')
+        chunks = [
+            content[i:i+chunk_size]
+            for i in range(0, len(content), chunk_size)
+        ]
+        pieces = []
+        progress = []
+        found = extract_field(
+            chunks,
+            field,
+            pieces.append,
+            lambda received, total: progress.append(received),
+            len(content),
+        )
+        self.assertEqual(progress[-1], len(content))
+        return found, ''.join(pieces)
+
+    def test_escapes(self):
+        data = '<qgis a="1">\n\t\\ / \b\f\r</qgis>'
+        for chunk_size in (1, 2, 3, 1024):
+            found, value = self.extract({'data': data}, chunk_size=chunk_size)
+            self.assertTrue(found)
+            self.assertEqual(value, data)
+
+    def test_unicode(self):
+        data = 'Lleida àéíòú € \U0001F600'
+        for ensure_ascii in (True, False):
+            for chunk_size in (1, 5, 1024):
+                found, value = self.extract(
+                    {'data': data},
+                    chunk_size=chunk_size,
+                    ensure_ascii=ensure_ascii,
+                )
+                self.assertEqual(value, data)
+
+    def test_other_fields(self):
+        document = {
+            'id': 3,
+            'name': 'a "data": "no"',
+            'nested': {'data': 'no'},
+            'list': ['data', {'data': 'no'}],
+            'data': 'yes',
+            'after': {'data': 'no'},
+        }
+        found, value = self.extract(document)
+        self.assertTrue(found)
+        self.assertEqual(value, 'yes')
+
+    def test_missing(self):
+        found, value = self.extract({'id': 3, 'name': 'data'})
+        self.assertFalse(found)
+        self.assertEqual(value, '')
+
+        found, value = self.extract({'id': 3, 'data': None})
+        self.assertFalse(found)
+        self.assertEqual(value, '')
+
+    def test_multipart(self):
+        content = '<qgis>Lleida àéíòú</qgis>'.encode('utf-8') * 1000
+        with tempfile.TemporaryFile() as f:
+            f.write(content)
+            f.seek(0)
+
+            progress = []
+            body = MultipartBody(
+                [('name', 'projecte'), ('access_token', None), ('data', f)],
+                lambda sent, total: progress.append((sent, total)),
+            )
+            chunks = []
+            while True:
+                chunk = body.read(1000)
+                if not chunk:
+                    break
+                self.assertLessEqual(len(chunk), 1000)
+                chunks.append(chunk)
+            sent = b''.join(chunks)
+
+        self.assertEqual(len(sent), len(body))
+        self.assertEqual(progress[-1], (len(body), len(body)))
+
+        message = email.message_from_bytes(
+            b'Content-Type: ' + body.content_type.encode() + b'\r\n\r\n' +
+            sent
+        )
+        fields = {
+            part.get_param('name', header='content-disposition'):
+                part.get_payload(decode=True)
+            for part in message.get_payload()
+        }
+        self.assertEqual(fields, {'name': b'projecte', 'data': content})
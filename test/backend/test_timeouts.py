@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""
+Test units for the package backend.timeouts.
+"""
+
+import time
+from unittest import TestCase, mock
+
+from requests.exceptions import ReadTimeout
+
+from .constants import Test
+from backend.constants import Http
+from backend.giscube import Giscube
+from backend.timeouts import DeadlineExceeded, deadline, remaining, \
+    request_timeout
+
+from .mocks import mocked_post
+
+
+class TestTimeouts(TestCase):
+    def test_request_timeout(self):
+        self.assertIsNone(remaining())
+        self.assertEqual(
+            request_timeout(),
+            (Http.CONNECT_TIMEOUT, Http.READ_TIMEOUT),
+        )
+        self.assertEqual(request_timeout(5), (5, 5))
+
+        with deadline(2):
+            connect, read = request_timeout((1, 30))
+            self.assertEqual(connect, 1)
+            self.assertLessEqual(read, 2)
+
+            with deadline(60):
+                # Nested deadlines can't extend it
+                self.assertLessEqual(remaining(), 2)
+
+        self.assertIsNone(remaining())
+
+    def test_expired(self):
+        with deadline(0.01):
+            time.sleep(0.05)
+            with self.assertRaises(DeadlineExceeded):
+                request_timeout()
+
+    @mock.patch('requests.Session.post', mock.Mock(side_effect=mocked_post))
+    def test_try_request(self):
+        giscube = Giscube(Test.URL, Test.CLIENT_ID, False)
+
+        def slow_request():
+            time.sleep(0.05)
+            raise ReadTimeout()
+
+        with self.assertRaises(ReadTimeout) as cm:
+            giscube.try_request(slow_request)
+        self.assertNotIsInstance(cm.exception, DeadlineExceeded)
+
+        with deadline(0.01):
+            with self.assertRaises(DeadlineExceeded):
+                giscube.try_request(slow_request)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Test units for the package backend.token_store.
+"""
+
+from unittest import TestCase, mock
+
+from .constants import Test
+from backend.giscube import Giscube
+from backend.token_store import TokenStore
+
+
+class TestTokenStore(TestCase):
+    @mock.patch('keyring.delete_password')
+    @mock.patch('keyring.set_password')
+    @mock.patch('keyring.get_password', mock.Mock(return_value='saved'))
+    def test_write_behind(self, set_password, delete_password):
+        scheduled = []
+        store = TokenStore(
+            scheduler=lambda delay, flush: scheduled.append(flush),
+        )
+
+        # Reads are cached
+        self.assertEqual(store.get('service', 'key'), 'saved')
+        self.assertEqual(store.get('service', 'key'), 'saved')
+        self.assertEqual(store.reads, 1)
+
+        # Unchanged values are not written
+        store.set('service', 'key', 'saved')
+        self.assertEqual(store.pending, 0)
+
+        # Several changes are saved together by a single flush
+        store.set('service', 'key', 'first')
+        store.set('service', 'key', 'second')
+        store.delete('service', 'other')
+        self.assertEqual(store.get('service', 'key'), 'second')
+        self.assertEqual(len(scheduled), 1)
+        self.assertEqual(store.pending, 2)
+        set_password.assert_not_called()
+
+        scheduled[0]()
+        set_password.assert_called_once_with('service', 'key', 'second')
+        delete_password.assert_called_once_with('service', 'other')
+        self.assertEqual(store.pending, 0)
+        self.assertEqual(store.writes, 2)
+
+    @mock.patch('keyring.set_password')
+    @mock.patch('keyring.get_password', mock.Mock(return_value=None))
+    def test_synchronous(self, set_password):
+        store = TokenStore()
+        store.set('service', 'key', 'value')
+        set_password.assert_called_once_with('service', 'key', 'value')
+
+    @mock.patch('keyring.get_password', mock.Mock(return_value='saved'))
+    def test_deferred_loading(self):
+        store = TokenStore()
+        giscube = Giscube(Test.URL, Test.CLIENT_ID, False, 'deferred',
+                          token_store=store, load_tokens=False)
+        self.assertFalse(giscube.tokens_loaded)
+        self.assertEqual(store.reads, 0)
+
+        # Loaded when first needed
+        self.assertEqual(giscube.access_token, 'saved')
+        self.assertTrue(giscube.tokens_loaded)
+        self.assertEqual(store.reads, 2)
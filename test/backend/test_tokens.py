@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Test units for the refresh of the tokens of backend.giscube.
+"""
+
+import threading
+import time
+from unittest import TestCase, mock
+
+from .constants import Test
+from backend.giscube import Giscube
+
+from .mocks import MockResponse
+
+
+class MockTokenServer:
+    """
+    Token endpoint that gives tokens that expire in expires_in seconds.
+    """
+    def __init__(self, expires_in):
+        self.expires_in = expires_in
+        self.refreshes = 0
+        self.lock = threading.Lock()
+
+    def post(self, url='', params='', data=''):
+        with self.lock:
+            if data['grant_type'] == 'refresh_token':
+                self.refreshes += 1
+            n = self.refreshes
+        # Slow enough for the concurrent refreshes to overlap
+        time.sleep(0.1)
+        return MockResponse({
+            'access_token': 'access-{}'.format(n),
+            'refresh_token': 'refresh-{}'.format(n),
+            'expires_in': self.expires_in,
+        }, 200)
+
+
+class TestTokens(TestCase):
+    def test_single_flight(self):
+        server = MockTokenServer(3600)
+        with mock.patch('requests.Session.post',
+                        mock.Mock(side_effect=server.post)):
+            giscube = Giscube(Test.URL, Test.CLIENT_ID, False)
+            giscube.login(Test.USER, Test.PASSWORD)
+            stale = giscube.access_token
+
+            threads = [
+                threading.Thread(target=giscube.refresh_token, args=(stale,))
+                for _ in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(server.refreshes, 1)
+        self.assertEqual(giscube.access_token, 'access-1')
+        self.assertGreater(giscube.expires_in, 3500)
+
+    def test_proactive(self):
+        server = MockTokenServer(30)
+        with mock.patch('requests.Session.post',
+                        mock.Mock(side_effect=server.post)):
+            giscube = Giscube(Test.URL, Test.CLIENT_ID, False)
+            giscube.login(Test.USER, Test.PASSWORD)
+
+            tokens = []
+
+            def make_request():
+                tokens.append(giscube.access_token)
+                return MockResponse({}, 200)
+
+            giscube.try_request(make_request)
+
+        # Refreshed before the request because it was about to expire
+        self.assertEqual(server.refreshes, 1)
+        self.assertEqual(tokens, ['access-1'])
@@ -5,6 +5,8 @@ Test units for the package backend.utils.
 
 from unittest import TestCase
 
+import requests
+
 from backend import utils
 
 
@@ -26,3 +28,19 @@ class TestUrljoin(TestCase):
             utils.urljoin('file:///usr/bin/', 'level1', 'level2'),
             'file:///usr/bin/level1/level2'
         )
+
+
+class TestIsTransient(TestCase):
+    def test(self):
+        def http_error(status_code):
+            response = requests.Response()
+            response.status_code = status_code
+            return requests.HTTPError(response=response)
+
+        self.assertTrue(utils.is_transient(requests.ConnectionError()))
+        self.assertTrue(utils.is_transient(requests.Timeout()))
+        self.assertTrue(utils.is_transient(http_error(503)))
+        self.assertTrue(utils.is_transient(http_error(429)))
+
+        self.assertFalse(utils.is_transient(http_error(404)))
+        self.assertFalse(utils.is_transient(ValueError()))
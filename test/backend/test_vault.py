@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+"""
+Test units for the package backend.vault.
+"""
+
+from unittest import TestCase
+
+from backend import vault
+
+
+class TestVault(TestCase):
+    def test_backend(self):
+        name = vault.backend_name()
+        self.assertTrue(vault.is_loaded())
+        self.assertIs(vault.get_keyring(), vault.get_keyring())
+
+        module, _, cls = name.rpartition('.')
+        keyring = vault.get_keyring()
+        self.assertEqual(type(keyring.get_keyring()).__name__, cls)
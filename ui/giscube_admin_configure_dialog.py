@@ -6,6 +6,9 @@ This script contains GiscubeAdminConfigureDialog.
 import os
 
 from PyQt5 import QtWidgets, uic
+from PyQt5.QtWidgets import QFileDialog, QMessageBox
+
+from ..main_company import main_company
 
 FORM_CLASS, _ = uic.loadUiType(os.path.join(
     os.path.dirname(__file__), 'giscube_admin_configure_dialog_base.ui'))
@@ -25,3 +28,29 @@ class GiscubeAdminConfigureDialog(QtWidgets.QDialog, FORM_CLASS):
         self.setupUi(self)
 
         # Set current values
+        self.refresh_interval.setValue(settings.refresh_interval)
+        self.trace_jobs.setChecked(settings.trace_jobs)
+
+        self.export_trace.clicked.connect(lambda: self._export_trace())
+
+    def _export_trace(self):
+        """
+        Saves the trace of the background jobs as a Chrome trace file.
+        """
+        tracer = main_company.tracer
+        if tracer is None:
+            QMessageBox.information(
+                self,
+                "Export trace",
+                "Enable the tracing of the background jobs first.",
+            )
+            return
+
+        path, _ = QFileDialog.getSaveFileName(
+            self,
+            "Export trace",
+            "giscube-admin-trace.json",
+            "Chrome trace (*.json)",
+        )
+        if path:
+            tracer.export(path)
@@ -5,8 +5,12 @@ This script contains ProjectItem.
 
 from os.path import dirname, samefile
 
+from requests.exceptions import RequestException
+
 from ..backend.qgis_server import QgisServer
 from ..backend.exceptions import Unauthorized
+from ..backend.health import CircuitOpen
+from ..backend.utils import is_transient
 
 from PyQt5.QtCore import QSettings
 from PyQt5.QtWidgets import QMenu, QAction, QTreeWidgetItem, QMessageBox,\
@@ -15,6 +19,9 @@ from PyQt5.QtWidgets import QMenu, QAction, QTreeWidgetItem, QMessageBox,\
 from qgis.core import QgsProject
 from qgis.gui import QgsMessageBar
 
+from ..async import Job, CancellationToken, Priority, QueueFull, \
+    RetryPolicy
+from ..main_company import main_company
 from ..utils import safe_close, str2int
 
 from .publish_dialog import PublishDialog
@@ -25,6 +32,13 @@ class ProjectItem(QTreeWidgetItem):
     Server instance on the plugin's server tree UI.
     Controlls the interaction with the user.
     """
+    # Seconds a saved project waits before being uploaded: the saves made
+    #  meanwhile are uploaded at once
+    SAVE_DELAY = 2
+    # Item whose project is being downloaded to be opened: only the last one
+    #  asked is opened
+    _opening = None
+
     def __init__(self, id, name, server_item, published=None):
         """
         Contructor.
@@ -35,32 +49,137 @@ class ProjectItem(QTreeWidgetItem):
         self.name = name
         self.path = None
         self.published = published or {}
+        # Has the opened file been modified since it was downloaded or
+        #  uploaded?
+        self.dirty = False
+        # Number of saves, to know if an upload sent the last one
+        self._saves = 0
+        self._upload_handle = None
+        self._open_job = None
 
         self.server_item = server_item
         self.qgis_server = self.server_item.giscube.qgis_server
         self.iface = server_item.iface
 
         server_item.addChild(self)
-        self.setText(0, self.name)
+        self.setText(0, self.label)
+
+    @property
+    def label(self):
+        """
+        Text of the item: the name of the project, marked if it is dirty.
+        """
+        return self.name + (' *' if self.dirty else '')
+
+    def update(self, name, published=None):
+        """
+        Updates the data of the project with the data of the server.
+        """
+        self.name = name
+        self.published = published or {}
+        self.setText(0, self.label)
+
+    def set_dirty(self, dirty):
+        """
+        Marks the project as modified (or not) since it was downloaded or
+        uploaded.
+        :param dirty: Is it modified?
+        :type dirty: bool
+        """
+        self.dirty = dirty
+        self.setText(0, self.label)
+
+    def show_progress(self, received, total=None):
+        """
+        Shows the progress of the download of the project next to its name.
+        Call update (or clear_progress) to remove it.
+        :param received: Bytes received.
+        :type received: int
+        :param total: Size of the download, if known.
+        :type total: int or None
+        """
+        if total:
+            progress = '{:.0f}%'.format(100.0 * received / total)
+        else:
+            progress = '{:.1f} MB'.format(received / (1024.0 * 1024.0))
+        self.setText(0, '{} ({})'.format(self.label, progress))
+
+    def clear_progress(self):
+        """
+        Removes the progress shown by show_progress.
+        """
+        self.setText(0, self.label)
 
     def open(self):
         """
         Open the project that this item represents in the editor.
+        It is downloaded in the background (see OpenProjectJob), showing the
+        progress in the item, and read when it has been received. The
+        download can be cancelled with cancel_open, and it is cancelled when
+        another project is opened or read meanwhile.
         """
+        if self.is_opening:
+            return
+
         def open_project():
-            project = QgsProject.instance()
-            self.path = self.qgis_server.download_project(self.id)
-            project.read(self.path)
-            project.readProject.connect(close_project)
-            project.projectSaved.connect(save_project)
-            self.clean_recent_projects()
+            if ProjectItem._opening is not None:
+                # Also when it was cancelled with the jobs of its server
+                ProjectItem._opening.cancel_open()
+            job = OpenProjectJob(self)
+            if self.server_item.list_job(job):
+                self._open_job = job
+                ProjectItem._opening = self
+                QgsProject.instance().readProject.connect(self._read_other)
+                self.show_progress(0)
+
+        safe_close(self.iface, open_project)
+
+    @property
+    def is_opening(self):
+        """
+        Is the project being downloaded to be opened?
+        """
+        return self._open_job is not None and not self._open_job.is_cancelled
+
+    def cancel_open(self):
+        """
+        Cancels the download of the project being opened.
+        """
+        if self._open_job is not None:
+            self._open_job.cancel()
+            self._stop_opening()
+            self.clear_progress()
+
+    def _stop_opening(self):
+        self._open_job = None
+        if ProjectItem._opening is self:
+            ProjectItem._opening = None
+        QgsProject.instance().readProject.disconnect(self._read_other)
+
+    def _read_other(self):
+        # Another project was read while this one was being downloaded
+        self.cancel_open()
+
+    def _opened(self, path):
+        """
+        Reads the downloaded project in the editor, once the project opened
+        meanwhile (if any) is safely closed. Its saves are uploaded until
+        another project is read.
+        :param path: Path of the downloaded project.
+        :type path: str
+        """
+        self._stop_opening()
+        self.clear_progress()
+        safe_close(self.iface, lambda: self._read(path))
+
+    def _read(self, path):
+        self.path = path
+        project = QgsProject.instance()
+        project.read(self.path)
+        self.set_dirty(False)
 
         def save_project():
-            self.id = self.qgis_server.upload_project(
-                self.id,
-                self.name,
-                self.path,
-            )
+            self.save()
             self.clean_recent_projects()
 
         def close_project():
@@ -68,7 +187,46 @@ class ProjectItem(QTreeWidgetItem):
             project.readProject.disconnect(close_project)
             project.projectSaved.disconnect(save_project)
 
-        safe_close(self.iface, open_project)
+        project.readProject.connect(close_project)
+        project.projectSaved.connect(save_project)
+        self.clean_recent_projects()
+
+    def _open_failed(self):
+        """
+        The project could not be downloaded.
+        """
+        self._stop_opening()
+        self.clear_progress()
+
+    def save(self):
+        """
+        Uploads the opened project in the background after SAVE_DELAY
+        seconds. The saves made meanwhile, or while it is waiting for a
+        slave, are uploaded once, with the last contents of the file.
+        """
+        self._saves += 1
+        if self._upload_handle is not None:
+            self._upload_handle.cancel()
+        self._upload_handle = main_company.schedule(
+            UploadProjectJob(self),
+            self.SAVE_DELAY,
+        )
+
+    def flush_upload(self):
+        """
+        Lists the upload of a save that is still waiting for SAVE_DELAY, so
+        it isn't lost when the scheduled jobs are cancelled (see
+        main_company.shutdown).
+        """
+        handle = self._upload_handle
+        self._upload_handle = None
+        if handle is None or handle.is_cancelled:
+            return
+
+        # If it was just listed by the timer, they are merged, and if it is
+        #  already being uploaded the unchanged file isn't sent again
+        handle.cancel()
+        self.server_item.list_job(UploadProjectJob(self))
 
     def _double_clicked(self):
         self.open()
@@ -76,6 +234,14 @@ class ProjectItem(QTreeWidgetItem):
     def context_menu(self, pos):
         menu = QMenu()
 
+        if self.is_opening:
+            def cancel_open():
+                self.cancel_open()
+            cancel_action = QAction('Cancel opening')
+            menu.addAction(cancel_action)
+            cancel_action.triggered.connect(cancel_open)
+            menu.addSeparator()
+
         def open_():
             self.open()
         open_action = QAction('Open project')
@@ -138,7 +304,7 @@ class ProjectItem(QTreeWidgetItem):
                 )
                 if result == self.id:
                     self.name = name
-                    self.setText(0, self.name)
+                    self.setText(0, self.label)
             except Unauthorized:
                 self.iface.messageBar().pushMessage(
                     "Error",
@@ -157,3 +323,177 @@ class ProjectItem(QTreeWidgetItem):
                 qgis_settings.remove(group)
 
         qgis_settings.endGroup()
+
+
+class OpenProjectJob(Job):
+    """
+    Downloads the project of a ProjectItem asynchronously, reporting the
+    bytes received, and opens it in the GUI thread. It is cancelled alone
+    (see ProjectItem.cancel_open) or with the rest of the jobs of the server.
+    Transient network errors are retried with backoff.
+    """
+    RETRY = RetryPolicy(
+        max_attempts=3,
+        base=1.0,
+        cap=10.0,
+        retryable=is_transient,
+    )
+
+    def __init__(self, item):
+        """
+        Contructor.
+        """
+        si = item.server_item
+        super().__init__(
+            priority=Priority.INTERACTIVE,
+            lane=si.lane,
+            token=CancellationToken(si.token),
+            retry=self.RETRY,
+        )
+        self.item = item
+        self.project_id = item.id
+        self.path = None
+
+    def do_work(self):
+        """
+        Do the asynchronous job.
+        Downloads the project, stopping if the job is cancelled.
+        """
+        self.path = self.item.qgis_server.download_project(
+            self.project_id,
+            self.__progress,
+        )
+
+    def __progress(self, received, total):
+        self.token.raise_if_cancelled()
+        self.report_progress(received, total)
+
+    def progress_changed(self, received, total):
+        """
+        Shows the progress of the download.
+        """
+        self.item.show_progress(received, total)
+
+    def apply_result(self):
+        """
+        Opens the downloaded project.
+        """
+        self.item._opened(self.path)
+
+    def exception_risen(self, exception):
+        """
+        Tells the user that the project couldn't be opened.
+        """
+        self.item._open_failed()
+        if isinstance(exception, Unauthorized):
+            message = "Couldn't open the project, log in again"
+        elif isinstance(exception, CircuitOpen):
+            message = "Couldn't open the project, the server is unavailable"
+        elif isinstance(exception, RequestException):
+            message = "Couldn't download the project"
+        else:
+            raise exception
+        self.item.iface.messageBar().pushMessage(
+            "Error",
+            message,
+            QgsMessageBar.ERROR
+        )
+
+
+class UploadProjectJob(Job):
+    """
+    Uploads the file of a ProjectItem asynchronously. The uploads of a
+    project that are waiting to be worked on are merged: the file is read
+    when the job is worked on, so only its last contents are sent. Unchanged
+    files are not sent (see QgisServer.is_modified), and the item is marked
+    dirty while a modified one is being sent or if it couldn't be sent.
+    Transient network errors are retried with backoff.
+    """
+    RETRY = RetryPolicy(
+        max_attempts=4,
+        base=1.0,
+        cap=20.0,
+        retryable=is_transient,
+    )
+
+    def __init__(self, item):
+        """
+        Contructor.
+        """
+        si = item.server_item
+        super().__init__(
+            lane=si.lane,
+            coalesce_key=('upload_project', si.name, item.id),
+            token=si.token,
+            retry=self.RETRY,
+        )
+        self.item = item
+        self.project_id = item.id
+        self.name = item.name
+        self.path = item.path
+        self.saves = item._saves
+
+    def do_work(self):
+        """
+        Do the asynchronous job.
+        Uploads the file if it is different from the project in the server,
+        reporting the bytes sent.
+        """
+        qgis_server = self.item.qgis_server
+        if not qgis_server.is_modified(self.project_id, self.path):
+            return
+
+        # Marks the item dirty
+        self.report_progress(0, None)
+        self.project_id = qgis_server.upload_project(
+            self.project_id,
+            self.name,
+            self.path,
+            self.report_progress,
+        )
+
+    def progress_changed(self, sent, total):
+        """
+        The file is modified: shows the progress of its upload.
+        """
+        self.item.set_dirty(True)
+        self.item.show_progress(sent, total)
+
+    def merge(self, job):
+        """
+        Takes the name and counts the saves of the merged job.
+        """
+        self.name = job.name
+        self.saves = max(self.saves, job.saves)
+
+    def apply_result(self):
+        """
+        The server has the saved project. If it was saved again meanwhile,
+        the next upload tells if it is still dirty.
+        """
+        self.item.id = self.project_id
+        if self.saves == self.item._saves:
+            self.item.set_dirty(False)
+        else:
+            self.item.clear_progress()
+
+    def exception_risen(self, exception):
+        """
+        Tells the user that the project couldn't be uploaded. It is dirty.
+        """
+        self.item.set_dirty(True)
+        if isinstance(exception, Unauthorized):
+            message = "Couldn't upload the project, log in again"
+        elif isinstance(exception, CircuitOpen):
+            message = "Couldn't upload the project, the server is unavailable"
+        elif isinstance(exception, QueueFull):
+            message = "Couldn't upload the project, too many pending requests"
+        elif isinstance(exception, RequestException):
+            message = "Couldn't upload the project"
+        else:
+            raise exception
+        self.item.iface.messageBar().pushMessage(
+            "Error",
+            message,
+            QgsMessageBar.ERROR
+        )
@@ -15,9 +15,13 @@ from qgis.gui import QgsMessageBar
 from ..settings import Settings
 
 from ..backend import Unauthorized
+from ..backend.health import CircuitOpen, ServerHealth
+from ..backend.timeouts import DeadlineExceeded
+from ..backend.utils import is_transient
 
-from ..async import Job
-from ..main_company import main_company
+from ..async import Job, CancellationToken, FunctionJob, Overflow, Priority, \
+    QueueFull, RetryPolicy
+from ..main_company import main_company, SERVER_SLAVES, SERVER_QUEUE_JOBS
 
 from .loading_item import LoadingItem
 from .project_item import ProjectItem
@@ -35,6 +39,10 @@ class ServerItem(QTreeWidgetItem):
         Settings.PROJECT + '-servers',
     )
 
+    # Seconds before the access token expires when it is refreshed in the
+    #  background
+    TOKEN_REFRESH_AHEAD = 300
+
     def __init__(self, conn, tree, giscube_admin):
         """
         Contructor.
@@ -51,10 +59,21 @@ class ServerItem(QTreeWidgetItem):
         self.iface = giscube_admin.iface
         self.giscube = conn
         self._tree = tree
+        self.token = CancellationToken()
+        self._refresh_handle = None
+        self._token_refresh_handle = None
+
+        main_company.add_lane(
+            self.lane,
+            SERVER_SLAVES,
+            SERVER_QUEUE_JOBS,
+            Overflow.REJECT,
+        )
 
         tree.addTopLevelItem(self)
 
-        self.setText(0, self.name)
+        self.giscube.health.listener = self.__health_changed
+        self.update_health()
 
         key = self.name+'/url'
         if not self.saved_servers.contains(key):
@@ -77,13 +96,88 @@ class ServerItem(QTreeWidgetItem):
         """
         return self.giscube.server_url
 
+    @property
+    def lane(self):
+        """
+        Name of the main company's lane of the jobs of this server.
+        """
+        return 'server/' + self.name
+
+    def update_health(self):
+        """
+        Shows the health of the server: its state in the text and its error
+        rate and latency in the tooltip.
+        """
+        health = self.giscube.health
+        state = health.state
+        text = self.name
+        if state == ServerHealth.OPEN:
+            text += ' (unavailable)'
+        elif state == ServerHealth.HALF_OPEN:
+            text += ' (reconnecting)'
+        self.setText(0, text)
+
+        tooltip = self.giscube.server_url
+        error_rate = health.error_rate
+        if error_rate is not None:
+            tooltip += '\nErrors: {:.0%}'.format(error_rate)
+        latency = health.latency
+        if latency is not None:
+            tooltip += '\nLatency: {:.0f} ms'.format(latency * 1000)
+        self.setToolTip(0, tooltip)
+
+    def __health_changed(self, state):
+        # Called from the thread of the request
+        main_company.dispatcher.post(UpdateHealthJob(self))
+
+    def list_job(self, job):
+        """
+        Lists a job in the main company. Tells the user if there are too many
+        pending requests to the server. Returns if it was listed.
+        :param job: Job of this server.
+        :type job:  .async.Job
+        """
+        try:
+            main_company.list_job(job)
+        except QueueFull:
+            self.iface.messageBar().pushMessage(
+                "Error",
+                "Too many pending requests to the server",
+                Qgis.Warning
+            )
+            return False
+        return True
+
+    def cancel_jobs(self):
+        """
+        Cancels the listed and running jobs of this server.
+        """
+        self.token.cancel()
+        self.token = CancellationToken()
+
+    def flush_uploads(self):
+        """
+        Lists the pending uploads of the saved projects of this server.
+        """
+        for i in range(self.childCount()):
+            child = self.child(i)
+            if isinstance(child, ProjectItem):
+                child.flush_upload()
+
     def delete(self):
         """
         Remove this server instance and its data (including the saved) and
         update the UI.
         """
+        self.stop_refreshing()
+        self.stop_token_refresh()
+        self.cancel_jobs()
+
         # Remove tokens and prevent saving them again
         self.giscube.remove_tokens()
+        self.giscube.health.listener = None
+        self.giscube.close()
+        main_company.remove_lane(self.lane)
 
         # Remove from configuration file
         key = self.name+'/url'
@@ -96,12 +190,75 @@ class ServerItem(QTreeWidgetItem):
         self._tree.takeTopLevelItem(index)
 
     def refresh_projects(self):
-        main_company.list_job(ListProjectsJob(self))
+        self.list_job(ListProjectsJob(self))
+
+    def start_refreshing(self):
+        """
+        Refreshes the projects list periodically in the background (see
+        Settings.refresh_interval).
+        """
+        self.stop_refreshing()
+        interval = self.giscube_admin.settings.refresh_interval
+        if interval > 0:
+            self._refresh_handle = main_company.schedule_every(
+                lambda: ListProjectsJob(self, background=True),
+                interval * 60,
+                jitter=0.1,
+            )
+
+    def stop_refreshing(self):
+        """
+        Stops the periodic refresh of the projects list.
+        """
+        if self._refresh_handle is not None:
+            self._refresh_handle.cancel()
+            self._refresh_handle = None
+
+    def schedule_token_refresh(self):
+        """
+        Refreshes the access token in the background before it expires, so
+        the requests don't have to wait for it. It is scheduled again after
+        each refresh.
+        """
+        self.stop_token_refresh()
+        expires_in = self.giscube.expires_in
+        if expires_in is None or not self.giscube.has_refresh_token:
+            return
+
+        job = FunctionJob(
+            main_company,
+            self.giscube.refresh_token,
+            (self.giscube.access_token,),
+            priority=Priority.BACKGROUND,
+            lane=self.lane,
+        )
+        job.token = self.token
+
+        def refreshed(future):
+            if future.cancelled():
+                # With the rest of the jobs of the server
+                return
+            if future.exception() is None and future.result():
+                self.schedule_token_refresh()
+        job.future.add_done_callback(refreshed)
+
+        self._token_refresh_handle = main_company.schedule(
+            job,
+            max(expires_in - self.TOKEN_REFRESH_AHEAD, expires_in / 2),
+        )
+
+    def stop_token_refresh(self):
+        """
+        Cancels the scheduled refresh of the access token.
+        """
+        if self._token_refresh_handle is not None:
+            self._token_refresh_handle.cancel()
+            self._token_refresh_handle = None
 
     def new_project_dialog(self):
         def popup():
             self.giscube_admin.new_project_popup(self.name)
-        main_company.list_job(ListProjectsJob(self, popup))
+        self.list_job(ListProjectsJob(self, popup))
 
     def context_menu(self, pos):
         menu = QMenu()
@@ -121,6 +278,9 @@ class ServerItem(QTreeWidgetItem):
         menu.addSeparator()
 
         def logout():
+            self.stop_refreshing()
+            self.stop_token_refresh()
+            self.cancel_jobs()
             self.giscube.remove_tokens()
             self.setExpanded(False)
             self.takeChildren()
@@ -146,16 +306,26 @@ class ServerItem(QTreeWidgetItem):
 
     def _expanded(self):
         if isinstance(self.child(0), LoadingItem):
-            if not self.giscube.is_logged_in:
+            # If the saved tokens are still being loaded, the job waits for
+            #  them and asks to login if there are none.
+            if self.giscube.tokens_loaded and not self.giscube.is_logged_in:
                 if not self._login_popup():
                     self.setExpanded(False)
                     return
-            main_company.list_job(ListProjectsJob(self))
+            self.list_job(ListProjectsJob(self))
+        self.start_refreshing()
+
+    def _collapsed(self):
+        self.stop_refreshing()
+        if isinstance(self.child(0), LoadingItem):
+            # The projects are no longer needed
+            self.cancel_jobs()
 
     def _try_login(self, username, password, save_tokens):
         try:
             if self.giscube.login(username, password):
                 self.giscube.save_tokens = save_tokens
+                self.schedule_token_refresh()
                 return {'finished': True, 'correct': True}
         except RequestException as e:
             self.iface.messageBar().pushMessage(
@@ -188,14 +358,38 @@ class ServerItem(QTreeWidgetItem):
 class ListProjectsJob(Job):
     """
     Lists the projects of a ServerItem asynchronously.
+    Listing the projects of a server that are already being listed only adds
+    the callback. Transient network errors are retried with backoff.
+    Background jobs (periodic refreshes) don't bother the user with errors.
     """
-    def __init__(self, si, callback=None):
+    # Seconds each attempt may take
+    DEADLINE = 30
+
+    RETRY = RetryPolicy(
+        max_attempts=4,
+        base=1.0,
+        cap=20.0,
+        retryable=is_transient,
+    )
+
+    def __init__(self, si, callback=None, background=False):
         """
         Contructor.
         """
-        super().__init__()
+        # Background refreshes are not merged with the user's requests: they
+        #  would make them wait with their priority
+        super().__init__(
+            priority=Priority.BACKGROUND if background else
+            Priority.INTERACTIVE,
+            lane=si.lane,
+            coalesce_key=('list_projects', si.name, background),
+            token=si.token,
+            retry=self.RETRY,
+            deadline=self.DEADLINE,
+        )
         self.si = si
-        self.callback = callback
+        self.callbacks = [callback] if callback is not None else []
+        self.background = background
         self.projects = None
         self.services = None
         self.succeded = False
@@ -212,36 +406,103 @@ class ListProjectsJob(Job):
     def apply_result(self):
         """
         Apply the results after the asynchronous job has been done.
-        Updates the GUI.
+        Updates the GUI, one project at a time. The items of the projects
+        already in the tree are kept (and updated).
         """
+        self.si.update_health()
         if self.succeded:
-            self.si.takeChildren()
+            items = {}
+            for i in range(self.si.childCount()):
+                child = self.si.child(i)
+                if isinstance(child, ProjectItem):
+                    items[child.id] = child
+            if len(items) != self.si.childCount():
+                # Loading placeholder
+                self.si.takeChildren()
+                items = {}
+
+            for pid, item in items.items():
+                if pid not in self.projects:
+                    self.si.removeChild(item)
+
             for pid, name in self.projects.items():
                 if pid in self.services:
                     service = self.services[pid]
                 else:
                     service = None
 
-                ProjectItem(pid, name, self.si, service)
-            if self.callback is not None:
-                self.callback()
+                if pid in items:
+                    items[pid].update(name, service)
+                else:
+                    ProjectItem(pid, name, self.si, service)
+                yield
+            for callback in self.callbacks:
+                callback()
+        elif self.background:
+            pass
         elif self.si._login_popup():
-            main_company.list_job(self)
+            self.si.list_job(self)
+
+    def merge(self, job):
+        """
+        Keeps the callbacks of the merged job.
+        """
+        self.callbacks.extend(job.callbacks)
 
     def exception_risen(self, exception):
         """
         Handle the exception if anything goes wrong.
         """
+        self.si.update_health()
+        if self.background:
+            if isinstance(exception, Unauthorized):
+                self.si.stop_refreshing()
+            return
+
         try:
             super().exception_risen(exception)
         except Unauthorized:
             # The saved credential expired. Remove them and start the loging
             #   and querying again.
             self.si.giscube.delete_saved()
-            self.si._login_popup()
+            if self.si._login_popup():
+                self.si.list_job(self)
+        except CircuitOpen as e:
+            self.si.iface.messageBar().pushMessage(
+                "Error",
+                "The server is unavailable, retrying in {:.0f} s".format(
+                    e.retry_in),
+                Qgis.Warning
+            )
+        except DeadlineExceeded:
+            self.si.iface.messageBar().pushMessage(
+                "Error",
+                "The server took too long to answer",
+                QgsMessageBar.ERROR
+            )
         except RequestException as e:
-            self.iface.messageBar().pushMessage(
+            self.si.iface.messageBar().pushMessage(
                 "Error",
                 "Couldn't connect to the server",
                 QgsMessageBar.ERROR
             )
+
+
+class UpdateHealthJob(Job):
+    """
+    Shows the new health of a ServerItem. It is not worked on, it is posted
+    directly to the dispatcher of the company from the thread of the request
+    that changed the health.
+    """
+    def __init__(self, si):
+        """
+        Contructor.
+        """
+        super().__init__()
+        self.si = si
+
+    def apply_result(self):
+        """
+        Updates the ServerItem.
+        """
+        self.si.update_health()
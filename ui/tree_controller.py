@@ -27,6 +27,11 @@ class TreeController:
                 item._expanded()
         tree.itemExpanded.connect(expanded)
 
+        def collapsed(item):
+            if isinstance(item, ServerItem):
+                item._collapsed()
+        tree.itemCollapsed.connect(collapsed)
+
         def double_clicked(item):
             if isinstance(item, ProjectItem):
                 item._double_clicked()